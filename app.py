@@ -1,26 +1,141 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Request, render_template, request, send_file, jsonify, Response, stream_with_context, url_for, redirect
+import io
 import os
+import re
+import json
+import hashlib
+import time
+import uuid
+import threading
+import queue
+import zipfile
+import zlib
+import itertools
+import tempfile
+import shutil
+import csv
+import sqlite3
+import operator
+from collections import deque, OrderedDict
+from contextlib import contextmanager, closing
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from bisect import bisect_left
+from functools import lru_cache
+from xml.etree import ElementTree
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import HTTPException
+try:
+    import fcntl
+except ImportError:  # Windows : les fichiers des processus terminés sont conservés
+    fcntl = None
 from werkzeug.utils import secure_filename
-import openpyxl
-from reportlab.pdfgen import canvas
+# openpyxl et le moteur de rendu de reportlab sont importés à la demande (voir
+# warm_up) : les routes qui ne lisent ni ne dessinent rien ne les chargent pas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm, mm
-from reportlab.lib import colors
-from datetime import datetime
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from datetime import date, datetime
+
+class InvoiceRequest(Request):
+    """Requête dont les fichiers envoyés restent en mémoire jusqu'à SPOOL_MAX_MEMORY"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Au-delà du seuil, le tampon est déplacé dans un fichier temporaire
+        return tempfile.SpooledTemporaryFile(max_size=app.config['SPOOL_MAX_MEMORY'], mode='rb+')
+
+def spool_file(source):
+    """Fichier réel d'un tampon d'upload, à passer aux lecteurs de classeurs.
+
+    Avant Python 3.11, SpooledTemporaryFile n'a ni seekable() ni readable(),
+    dont zipfile et io.TextIOWrapper ont besoin ; son fichier interne (BytesIO
+    en mémoire, fichier temporaire une fois débordé) les a. Les chemins et les
+    autres fichiers sont retournés tels quels.
+    """
+    if isinstance(source, tempfile.SpooledTemporaryFile):
+        return source._file
+    return source
 
 app = Flask(__name__)
+app.request_class = InvoiceRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'output'
+app.config['JOBS_FOLDER'] = 'jobs'
+app.config['CACHE_FOLDER'] = 'cache'
+app.config['METRICS_FOLDER'] = 'metrics'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
+# Taille jusqu'à laquelle un classeur envoyé est lu directement en mémoire ;
+# inférieure à MAX_CONTENT_LENGTH pour qu'un job en attente ne garde pas
+# jusqu'à 16 Mo de mémoire
+app.config['SPOOL_MAX_MEMORY'] = int(os.environ.get('SPOOL_MAX_MEMORY', 2 * 1024 * 1024))
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-123')
+# Nombre de processus de rendu PDF (0 = un par cœur)
+app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', 0)) or os.cpu_count() or 1
+# Lecture du classeur ligne par ligne (mode read-only d'openpyxl)
+app.config['STREAMING_INGESTION'] = os.environ.get('STREAMING_INGESTION', '1') != '0'
+# Nombre de lignes envoyées à la fois à un processus de rendu
+app.config['RENDER_BATCH_SIZE'] = int(os.environ.get('RENDER_BATCH_SIZE', 16))
+# Mode de sortie par défaut : un PDF par facture ('files') ou un seul PDF ('merged')
+app.config['OUTPUT_MODE'] = os.environ.get('OUTPUT_MODE', 'files')
+# Profil de rendu des PDF (voir RENDER_PROFILES), modifiable pour chaque upload
+app.config['RENDER_PROFILE'] = os.environ.get('RENDER_PROFILE', 'compact')
+# Taille du cache des factures rendues (0 pour le désactiver)
+app.config['RENDER_CACHE_MAX_ENTRIES'] = int(os.environ.get('RENDER_CACHE_MAX_ENTRIES', 10000))
+app.config['RENDER_CACHE_MAX_BYTES'] = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Stockage des PDF générés : 'local' (OUTPUT_FOLDER), 'memory' ou 's3'
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+# Taille du stockage en mémoire, seul ou devant le stockage principal
+app.config['STORAGE_MEMORY_BYTES'] = int(os.environ.get('STORAGE_MEMORY_BYTES', 64 * 1024 * 1024))
+app.config['STORAGE_MEMORY_TIER'] = os.environ.get('STORAGE_MEMORY_TIER', '0') == '1'
+app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+app.config['S3_PREFIX'] = os.environ.get('S3_PREFIX', '')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+# Rétention des PDF : durée de conservation depuis le dernier accès et taille
+# totale maximale, vérifiées toutes les RETENTION_INTERVAL secondes ; désactivées
+# par défaut (0), les PDF sont alors conservés indéfiniment
+app.config['OUTPUT_TTL'] = int(os.environ.get('OUTPUT_TTL', 0))
+app.config['OUTPUT_MAX_BYTES'] = int(os.environ.get('OUTPUT_MAX_BYTES', 0))
+app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', 300))
+app.config['RETENTION_INDEX'] = 'output_index.db'
+# Autres noms acceptés pour les colonnes attendues, en JSON :
+# {"TOTAL TTC": ["Total TTC", "Montant TTC"]}
+app.config['COLUMN_ALIASES'] = json.loads(os.environ.get('COLUMN_ALIASES', '{}'))
+# Lecture des fichiers CSV : séparateur, encodage et virgule décimale
+app.config['CSV_DELIMITER'] = os.environ.get('CSV_DELIMITER', ';')
+app.config['CSV_ENCODING'] = os.environ.get('CSV_ENCODING', 'utf-8-sig')
+app.config['CSV_DECIMAL_COMMA'] = os.environ.get('CSV_DECIMAL_COMMA', '1') == '1'
+# Validation des totaux avant le rendu ('off', 'continue' ou 'refuse', voir
+# VALIDATION_MODES), modifiable pour chaque upload, et écart toléré en centimes
+app.config['VALIDATION'] = os.environ.get('VALIDATION', 'continue')
+app.config['VALIDATION_TOLERANCE'] = int(os.environ.get('VALIDATION_TOLERANCE', 1))
+# Feuilles traitées par défaut : vide pour la feuille active, '*' pour toutes,
+# ou des noms séparés par des virgules ; modifiable pour chaque upload
+app.config['SHEETS'] = os.environ.get('SHEETS', '')
+# Nombre de feuilles d'un même classeur traitées en parallèle
+app.config['SHEET_WORKERS'] = int(os.environ.get('SHEET_WORKERS', 4))
+# Upload en morceaux : taille d'un morceau (inférieure à MAX_CONTENT_LENGTH),
+# taille maximale du classeur et durée de conservation d'un upload inachevé
+app.config['CHUNK_SIZE'] = int(os.environ.get('CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['CHUNKED_UPLOAD_MAX_SIZE'] = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+app.config['CHUNKED_UPLOAD_TTL'] = int(os.environ.get('CHUNKED_UPLOAD_TTL', 24 * 3600))
+# Index SQLite des factures générées (vide pour le désactiver)
+app.config['INVOICE_INDEX'] = os.environ.get('INVOICE_INDEX', 'invoices.db')
+# Téléchargements : durée de mise en cache par le navigateur (un PDF stocké ne
+# change jamais de contenu, 0 pour désactiver) et envoi des fichiers locaux
+# délégué au proxy frontal : '' (Python), 'x-accel' (nginx) ou 'x-sendfile'
+app.config['DOWNLOAD_MAX_AGE'] = int(os.environ.get('DOWNLOAD_MAX_AGE', 365 * 24 * 3600))
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '')
+# Emplacement interne nginx correspondant au dossier output/ (mode 'x-accel')
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-output/')
+app.config['USE_X_SENDFILE'] = app.config['DOWNLOAD_OFFLOAD'] == 'x-sendfile'
+# Nombre d'uploads traités simultanément en arrière-plan par processus
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# Durée de conservation de l'état des jobs et des lots (0 pour les garder indéfiniment)
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 7 * 24 * 3600))
 
 # Création des dossiers s'ils n'existent pas
-for folder in ['uploads', 'output']:
+for folder in ['uploads', 'output', 'jobs', 'cache', 'metrics']:
     os.makedirs(folder, exist_ok=True)
 
-ALLOWED_EXTENSIONS = {'xlsx'}
+ALLOWED_EXTENSIONS = {'xlsx', 'csv', 'ods'}
 
 # Définition des colonnes attendues dans l'ordre
 EXPECTED_COLUMNS = [
@@ -52,18 +167,9 @@ EXPECTED_COLUMNS = [
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def format_date(date_str):
-    """Convertir la date du format Excel au format j-m-a"""
-    try:
-        # Convertir la chaîne de date en objet datetime
-        if isinstance(date_str, str):
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-        else:
-            date_obj = date_str
-        # Formater la date au format j-m-a
-        return date_obj.strftime('%d-%m-%Y')
-    except Exception as e:
-        return date_str
+def format_date(value):
+    """Formater une date au format j-m-a"""
+    return value.strftime('%d-%m-%Y')
 
 def format_amount(amount):
     """Formater les montants avec deux décimales"""
@@ -78,218 +184,373 @@ def format_amount(amount):
     except (ValueError, TypeError):
         return "0,00"
 
-def number_to_letters(number):
-    """Convertir un nombre en lettres"""
-    units = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
-    tens = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante-dix", "quatre-vingt", "quatre-vingt-dix"]
-    teens = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf"]
-    
-    def convert_less_than_thousand(n):
-        if n == 0:
-            return ""
-        
-        result = []
-        # Centaines
-        if n >= 100:
-            if n // 100 == 1:
-                result.append("cent")
-            else:
-                result.extend([units[n // 100], "cent"])
-            n = n % 100
-        
-        # Dizaines et unités
-        if n >= 10:
-            if n < 20:
-                result.append(teens[n - 10])
-                return " ".join(result)
-            else:
-                ten_digit = n // 10
-                unit_digit = n % 10
-                if ten_digit == 7 or ten_digit == 9:
-                    result.append(tens[ten_digit - 1])
-                    if unit_digit == 1:
-                        result.append("et")
-                    result.append(teens[unit_digit])
-                else:
-                    result.append(tens[ten_digit])
-                    if unit_digit == 1 and ten_digit != 8:
-                        result.append("et")
-                    if unit_digit > 0:
-                        result.append(units[unit_digit])
-        elif n > 0:
-            result.append(units[n])
-        
-        return " ".join(result)
-    
-    if number == 0:
-        return "zéro"
-    
-    # Séparer les parties entière et décimale
-    parts = str(number).replace(',', '.').split('.')
-    integer_part = int(parts[0])
-    decimal_part = int(parts[1]) if len(parts) > 1 else 0
+def format_centimes(centimes):
+    """Formater un montant en centimes comme format_amount ('1 234,50')"""
+    units, cents = divmod(abs(centimes), 100)
+    sign = '-' if centimes < 0 else ''
+    return f"{sign}{units:,}".replace(',', ' ') + f",{cents:02d}"
+
+# Mots utilisés pour écrire les montants en lettres
+UNITS = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
+TENS = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante-dix", "quatre-vingt", "quatre-vingt-dix"]
+TEENS = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf"]
+
+# Nombre de montants en lettres mémorisés par processus
+AMOUNT_WORDS_CACHE_SIZE = 4096
+
+def _convert_less_than_thousand(n):
+    """Écrire en lettres un nombre entre 0 et 999"""
+    if n == 0:
+        return ""
     
     result = []
+    # Centaines
+    if n >= 100:
+        if n // 100 == 1:
+            result.append("cent")
+        else:
+            result.extend([UNITS[n // 100], "cent"])
+        n = n % 100
     
-    # Traiter la partie entière
-    if integer_part == 0:
-        result.append("zéro")
-    else:
-        # Millions
-        if integer_part >= 1000000:
-            millions = integer_part // 1000000
-            if millions == 1:
-                result.append("un million")
-            else:
-                result.extend([convert_less_than_thousand(millions), "millions"])
-            integer_part = integer_part % 1000000
-        
-        # Milliers
-        if integer_part >= 1000:
-            thousands = integer_part // 1000
-            if thousands == 1:
-                result.append("mille")
+    # Dizaines et unités
+    if n >= 10:
+        if n < 20:
+            result.append(TEENS[n - 10])
+            return " ".join(result)
+        else:
+            ten_digit = n // 10
+            unit_digit = n % 10
+            if ten_digit == 7 or ten_digit == 9:
+                result.append(TENS[ten_digit - 1])
+                if unit_digit == 1:
+                    result.append("et")
+                result.append(TEENS[unit_digit])
             else:
-                result.extend([convert_less_than_thousand(thousands), "mille"])
-            integer_part = integer_part % 1000
-        
-        # Reste
-        if integer_part > 0:
-            result.append(convert_less_than_thousand(integer_part))
-    
-    # Ajouter "dirhams"
-    result.append("dirhams")
+                result.append(TENS[ten_digit])
+                if unit_digit == 1 and ten_digit != 8:
+                    result.append("et")
+                if unit_digit > 0:
+                    result.append(UNITS[unit_digit])
+    elif n > 0:
+        result.append(UNITS[n])
     
-    # Traiter la partie décimale
-    if decimal_part > 0:
-        result.append("et")
-        result.append(convert_less_than_thousand(decimal_part))
-        result.append("centimes")
+    return " ".join(result)
+
+# Table des nombres de 0 à 999 en lettres, calculée une seule fois
+WORDS_BELOW_THOUSAND = [_convert_less_than_thousand(n) for n in range(1000)]
+
+# Groupes de trois chiffres : (valeur, forme pour 1, forme du pluriel)
+NUMBER_GROUPS = [
+    (1000000000, "un milliard", "milliards"),
+    (1000000, "un million", "millions"),
+    (1000, "mille", "mille")
+]
+
+def integer_to_letters(n):
+    """Écrire en lettres un entier positif"""
+    if n < 1000:
+        return WORDS_BELOW_THOUSAND[n]
+    result = []
+    for value, singular, plural in NUMBER_GROUPS:
+        count, n = divmod(n, value)
+        if count == 1:
+            result.append(singular)
+        elif count > 1:
+            result.extend([integer_to_letters(count), plural])
+    if n > 0:
+        result.append(WORDS_BELOW_THOUSAND[n])
+    return " ".join(result)
+
+def to_centimes(amount):
+    """Convertir un montant (nombre ou chaîne '1 234,50') en centimes entiers"""
+    if type(amount) is int:
+        return amount * 100
+    if type(amount) is float:
+        scaled = amount * 100
+        rounded = round(scaled)
+        # Au plus deux décimales : aucun arrondi à trancher, inutile de passer par Decimal
+        if abs(scaled - rounded) < 1e-6:
+            return rounded
+    if isinstance(amount, str):
+        amount = amount.replace(' ', '').replace(',', '.')
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+@lru_cache(maxsize=AMOUNT_WORDS_CACHE_SIZE)
+def centimes_to_letters(centimes):
+    """Écrire en lettres un montant exprimé en centimes"""
+    if centimes == 0:
+        return "zéro"
+    if centimes < 0:
+        return f"Moins {centimes_to_letters(-centimes).lower()}"
     
+    dirhams, cents = divmod(centimes, 100)
+    result = [integer_to_letters(dirhams) if dirhams else "zéro", "dirhams"]
+    if cents > 0:
+        result.extend(["et", WORDS_BELOW_THOUSAND[cents], "centimes"])
     return " ".join(result).capitalize()
 
-def create_invoice_pdf(data, output_path):
-    """Créer une facture PDF avec les données fournies"""
-    c = canvas.Canvas(output_path, pagesize=A4)
+def number_to_letters(number):
+    """Convertir un nombre en lettres"""
+    return centimes_to_letters(to_centimes(number))
+
+def amounts_to_letters(amounts):
+    """Convertir une colonne de montants en lettres en un seul appel"""
+    return [centimes_to_letters(centimes) for centimes in map(to_centimes, amounts)]
+
+# Profils de rendu : options du canvas et métadonnées du document
+RENDER_PROFILES = {
+    # Impression en lot : pages non compressées
+    'fast': {'canvas': {'pageCompression': 0}, 'metadata': False},
+    'compact': {'canvas': {'pageCompression': 1}, 'metadata': False},
+    # Conservation longue durée : compressé, déterministe (un même lot donne
+    # les mêmes octets, les doublons se dédupliquent) et décrit
+    'archive': {'canvas': {'pageCompression': 1, 'invariant': 1, 'lang': 'fr-FR'}, 'metadata': True},
+}
+
+def new_canvas(output, profile, title, invariant=None):
+    """Créer un canvas A4 selon un profil de rendu (voir RENDER_PROFILES)"""
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+    register_fonts()
+    # Flux compressés écrits en binaire : l'encodage ASCII85 (prévu pour les
+    # transports 7 bits) grossit les PDF d'un quart et ralentit leur écriture
+    rl_config.useA85 = 0
+    options = dict(RENDER_PROFILES[profile]['canvas'])
+    if invariant is not None:
+        options['invariant'] = invariant
+    c = canvas.Canvas(output, pagesize=A4, **options)
+    if RENDER_PROFILES[profile]['metadata']:
+        c.setTitle(title)
+        c.setSubject('Facture de location de véhicule')
+        c.setCreator('Factures PDF')
+    return c
+
+def create_invoice_pdf(data, output, profile='compact'):
+    """Créer une facture PDF avec les données fournies (chemin ou fichier ouvert)"""
+    # Sortie déterministe : mêmes données, mêmes octets (voir RenderCache)
+    c = new_canvas(output, profile, f"Facture {data['Facture Numero']}", invariant=1)
+    draw_invoice(c, data)
+    c.save()
+
+def create_invoices_pdf(rows, output, profile='compact'):
+    """Créer un seul PDF contenant une page par facture (générateur).
+
+    Toutes les pages partagent le même canvas et donc les mêmes ressources
+    (polices, en-tête du document). Produit (row_idx, None, erreur, durée) pour
+    chaque ligne de `rows` ; `output` (chemin ou fichier ouvert) est écrit une
+    fois toutes les lignes traitées.
+    """
+    c = new_canvas(output, profile, 'Factures')
+    pages = 0
+    for row_idx, row_data in rows:
+        start = time.perf_counter()
+        try:
+            draw_invoice(c, row_data, shared_layout=True)
+        except Exception as e:
+            yield row_idx, None, str(e), time.perf_counter() - start
+            continue
+        c.showPage()
+        pages += 1
+        yield row_idx, None, None, time.perf_counter() - start
+    if pages:
+        c.save()
+
+# Version de la mise en page : à incrémenter à chaque modification du dessin
+LAYOUT_VERSION = 1
+LAYOUT_FORM_NAME = f"invoiceLayout{LAYOUT_VERSION}"
+
+# Positions communes à toutes les factures
+TOP_MARGIN = A4[1] - 6*cm  # Réduit de 7cm à 6cm
+TABLE_LEFT = 30
+TABLE_RIGHT = 550
+COL_MONTANT = 450
+HEADER_HEIGHT = 20
+# Première ligne du tableau des prestations
+TABLE_Y = TOP_MARGIN - 80 - 120 - 5
+
+# Autres prestations
+PRESTATIONS = [
+    ("Surclassement", "Surclassement HT"),
+    ("2ème Conducteur", "Sup 2eme Conducteur HT"),
+    ("Out of Hours", "Out of Hours HT"),
+    ("CDW", "CDW HT"),
+    ("TPC", "TPC HT"),
+    ("PAI", "PAI HT"),
+    ("SUPER CDW", "SUPER CDW HT"),
+    ("GPS", "GPS HT"),
+    ("Siège Bébé", "Siege Bebe HT"),
+    ("One Way", "One Way HT")
+]
+
+# Polices TrueType optionnelles (chemins de fichiers .ttf) ; sans configuration,
+# les factures utilisent Helvetica, limitée aux caractères latins courants
+app.config['FONT_REGULAR'] = os.environ.get('FONT_REGULAR')
+app.config['FONT_BOLD'] = os.environ.get('FONT_BOLD')
+# Nombre de sous-ensembles de police gardés en mémoire par police et par processus
+FONT_SUBSET_CACHE_SIZE = 1024
+
+# Polices utilisées pour le dessin (remplacées par register_fonts)
+INVOICE_FONT = 'Helvetica'
+INVOICE_FONT_BOLD = 'Helvetica-Bold'
+_fonts_registered = False
+
+def cached_subset_font(name, filename):
+    """Police TrueType dont les sous-ensembles embarqués sont calculés une fois.
+
+    Le fichier est lu à la création ; chaque sous-ensemble produit (mêmes
+    caractères, mêmes octets) est ensuite réutilisé, déjà compressé, par tous
+    les documents du processus au lieu d'être reconstruit à chaque facture.
+    """
+    from reportlab.pdfbase import pdfdoc
+    from reportlab.pdfbase.ttfonts import TTFont
+    font = TTFont(name, filename)
+    face = font.face
+    make_subset = face.makeSubset
+    add_subset_objects = face.addSubsetObjects
+
+    @lru_cache(maxsize=FONT_SUBSET_CACHE_SIZE)
+    def cached_subset(codes):
+        return make_subset(list(codes))
+
+    @lru_cache(maxsize=FONT_SUBSET_CACHE_SIZE)
+    def compressed_subset(codes):
+        return zlib.compress(cached_subset(codes))
+
+    def add_cached_subset_objects(doc, fontname, subset):
+        reference = add_subset_objects(doc, fontname, subset)
+        if doc.compression:
+            # Le flux de la police est remplacé par sa version déjà compressée
+            stream = doc.idToObject[f'fontFile:{face.filename}({fontname})']
+            stream.content = compressed_subset(tuple(subset))
+            stream.dictionary['Filter'] = pdfdoc.PDFName('FlateDecode')
+        return reference
+
+    face.makeSubset = lambda subset: cached_subset(tuple(subset))
+    face.addSubsetObjects = add_cached_subset_objects
+    return font
+
+def register_fonts():
+    """Enregistrer les polices TrueType configurées, une seule fois par processus.
+
+    Appelé par warm_up avant le fork des workers gunicorn et des processus de
+    rendu : les fichiers de police ne sont alors lus qu'une seule fois.
+    """
+    global INVOICE_FONT, INVOICE_FONT_BOLD, _fonts_registered
+    if _fonts_registered:
+        return
+    from reportlab.pdfbase import pdfmetrics
+    regular = app.config['FONT_REGULAR']
+    if regular:
+        bold = app.config['FONT_BOLD'] or regular
+        pdfmetrics.registerFont(cached_subset_font('InvoiceSans', regular))
+        pdfmetrics.registerFont(cached_subset_font('InvoiceSans-Bold', bold))
+        INVOICE_FONT = 'InvoiceSans'
+        INVOICE_FONT_BOLD = 'InvoiceSans-Bold'
+    # Métriques chargées maintenant plutôt qu'à la première facture
+    pdfmetrics.getFont(INVOICE_FONT)
+    pdfmetrics.getFont(INVOICE_FONT_BOLD)
+    _fonts_registered = True
+
+# Papier à en-tête optionnel (image ou PDF) dessiné sous la facture
+app.config['LETTERHEAD'] = os.environ.get('LETTERHEAD')
+
+# Papier à en-tête décodé une seule fois par processus
+_letterheads = {}
+
+def _load_letterhead(path):
+    """Charger le papier à en-tête (ImageReader ou page PDF) une fois par processus"""
+    if path not in _letterheads:
+        if path.lower().endswith('.pdf'):
+            try:
+                from pdfrw import PdfReader
+                from pdfrw.buildxobj import pagexobj
+            except ImportError:
+                raise RuntimeError('Le paquet pdfrw est requis pour un papier à en-tête PDF')
+            _letterheads[path] = ('pdf', pagexobj(PdfReader(path).pages[0]))
+        else:
+            from reportlab.lib.utils import ImageReader
+            _letterheads[path] = ('image', ImageReader(path))
+    return _letterheads[path]
+
+def draw_letterhead(c, path):
+    """Dessiner le papier à en-tête sur toute la page"""
     width, height = A4
+    kind, letterhead = _load_letterhead(path)
+    if kind == 'pdf':
+        from pdfrw.toreportlab import makerl
+        c.saveState()
+        c.scale(width / letterhead.BBox[2], height / letterhead.BBox[3])
+        c.doForm(makerl(c, letterhead))
+        c.restoreState()
+    else:
+        c.drawImage(letterhead, 0, 0, width=width, height=height, mask='auto')
 
-    # Configuration de la page
-    page_width = 595
-    page_height = 842
-    
-    # Définir la marge supérieure (ajustée pour redescendre légèrement)
-    top_margin = height - 6*cm  # Réduit de 7cm à 6cm
+def draw_invoice_layout(c):
+    """Dessiner la partie fixe de la facture (libellés, tableau, cadres)"""
+    if app.config['LETTERHEAD']:
+        draw_letterhead(c, app.config['LETTERHEAD'])
     
     # En-tête de la facture
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(30, top_margin, "FACTURE")
-    
-    # Numéro de facture et date (à gauche sous FACTURE)
-    c.setFont("Helvetica-Bold", 11)  
-    c.drawString(30, top_margin - 30, f"N° : {data['Facture Numero']}.")
-    c.drawString(30, top_margin - 50, f"Date : {format_date(data['Date de facture'])}.")
+    c.setFont(INVOICE_FONT_BOLD, 14)
+    c.drawString(30, TOP_MARGIN, "FACTURE")
     
     # Informations du client (à droite)
-    c.setFont("Helvetica-Bold", 11)  
-    c.drawString(400, top_margin - 30, "Client:")
-    c.setFont("Helvetica", 11)  
-    c.drawString(400, top_margin - 50, f"{str(data['Client'])}.")
+    c.setFont(INVOICE_FONT_BOLD, 11)  
+    c.drawString(400, TOP_MARGIN - 30, "Client:")
     
-    # Détails de la location
-    c.setFont("Helvetica-Bold", 11)
-    y = top_margin - 80
-    c.drawString(30, y, f"Véhicule : {data['Marque du Vehicule']}.")
-    c.drawString(30, y - 20, f"Immatriculation : {data['Matricule']}.")
-    c.drawString(30, y - 40, f"Période de location : Du {format_date(data['Date de Depart'])} au {format_date(data['Date de Retour'])}.")
-    
-    # Calcul du prix par jour avec TVA
-    prix_location_ht = float(str(data['Prix location total HT']).replace(' ', '').replace(',', '.'))
-    nombre_jours = int(data['Nombre de jours'])
-    prix_par_jour_ht = prix_location_ht / nombre_jours if nombre_jours > 0 else 0
-    prix_par_jour_ttc = prix_par_jour_ht * 1.20  # TVA 20%
-    
-    # Affichage du nombre de jours et prix par jour
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(30, y - 60, "Nombre de jours :")
-    c.setFont("Helvetica", 11)
-    c.drawString(120, y - 60, f"{data['Nombre de jours']}.")
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(150, y - 60, f"Prix par jour TTC : {format_amount(prix_par_jour_ttc)} MAD.")
+    # Nombre de jours
+    c.drawString(30, TOP_MARGIN - 140, "Nombre de jours :")
     
     # Tableau des prestations
-    y = y - 120  # Augmenté de -100 à -120 pour encore plus d'espace
-    
-    # Définir les dimensions du tableau
-    table_left = 30
-    table_right = 550
-    col_montant = 450
+    y = TOP_MARGIN - 200
 
     # En-tête du tableau avec fond gris
-    header_height = 20
     c.setFillColorRGB(0.9, 0.9, 0.9)
-    c.rect(table_left, y + 15, table_right - table_left, header_height, fill=1)
+    c.rect(TABLE_LEFT, y + 15, TABLE_RIGHT - TABLE_LEFT, HEADER_HEIGHT, fill=1)
     c.setFillColorRGB(0, 0, 0)
 
     # En-tête du tableau
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(table_left + 5, y + 20, "Désignation.")
-    c.drawString(col_montant, y + 20, "Montant HT.")
+    c.setFont(INVOICE_FONT_BOLD, 10)
+    c.drawString(TABLE_LEFT + 5, y + 20, "Désignation.")
+    c.drawString(COL_MONTANT, y + 20, "Montant HT.")
 
     # Ligne horizontale sous l'en-tête
-    c.line(table_left, y + 15, table_right, y + 15)
+    c.line(TABLE_LEFT, y + 15, TABLE_RIGHT, y + 15)
 
     # Prix de location
     y -= 5
-    c.setFont("Helvetica", 10)
-    c.drawString(table_left + 5, y, "Prix location")
-    c.drawString(col_montant, y, f"{format_amount(data['Prix location total HT'])} MAD")
-    c.line(table_left, y - 5, table_right, y - 5)
-
-    # Autres prestations
-    prestations = [
-        ("Surclassement", "Surclassement HT"),
-        ("2ème Conducteur", "Sup 2eme Conducteur HT"),
-        ("Out of Hours", "Out of Hours HT"),
-        ("CDW", "CDW HT"),
-        ("TPC", "TPC HT"),
-        ("PAI", "PAI HT"),
-        ("SUPER CDW", "SUPER CDW HT"),
-        ("GPS", "GPS HT"),
-        ("Siège Bébé", "Siege Bebe HT"),
-        ("One Way", "One Way HT")
-    ]
+    c.setFont(INVOICE_FONT, 10)
+    c.drawString(TABLE_LEFT + 5, y, "Prix location")
+    c.line(TABLE_LEFT, y - 5, TABLE_RIGHT, y - 5)
 
     # Point de départ pour les bordures verticales
-    start_y = y + header_height + 20
+    start_y = y + HEADER_HEIGHT + 20
 
     # Afficher toutes les prestations
-    for label, key in prestations:
+    for label, key in PRESTATIONS:
         y -= 20
-        c.drawString(table_left + 5, y, label)
-        c.drawString(col_montant, y, f"{format_amount(data[key])} MAD")
-        c.line(table_left, y - 5, table_right, y - 5)
+        c.drawString(TABLE_LEFT + 5, y, label)
+        c.line(TABLE_LEFT, y - 5, TABLE_RIGHT, y - 5)
 
     # Bordures verticales du tableau principal
-    c.line(table_left, start_y, table_left, y - 5)  # Gauche
-    c.line(col_montant - 20, start_y, col_montant - 20, y - 5)  # Avant montant
-    c.line(table_right, start_y, table_right, y - 5)  # Droite
+    c.line(TABLE_LEFT, start_y, TABLE_LEFT, y - 5)  # Gauche
+    c.line(COL_MONTANT - 20, start_y, COL_MONTANT - 20, y - 5)  # Avant montant
+    c.line(TABLE_RIGHT, start_y, TABLE_RIGHT, y - 5)  # Droite
 
     # Section des totaux
     y -= 20  # Espace avant les totaux
     totals_start_y = y + 15  # Ajusté pour un meilleur alignement
     
     # Dimensions de la section totaux
-    totals_width = table_right - (col_montant - 120)
+    totals_width = TABLE_RIGHT - (COL_MONTANT - 120)
     
     # Total HT
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col_montant - 100, y, "Total HT")
-    c.drawString(col_montant, y, f"{format_amount(data['Total Location HT'])} MAD")
+    c.setFont(INVOICE_FONT_BOLD, 10)
+    c.drawString(COL_MONTANT - 100, y, "Total HT")
     
     # TVA
     y -= 20
-    c.drawString(col_montant - 100, y, "TVA 20%")
-    c.drawString(col_montant, y, f"{format_amount(data['TVA 20 %'])} MAD")
+    c.drawString(COL_MONTANT - 100, y, "TVA 20%")
     
     # Total TTC
     y -= 20
@@ -297,153 +558,2440 @@ def create_invoice_pdf(data, output_path):
 
     # Bordures de la section totaux
     # Rectangle principal pour Total HT et TVA
-    c.rect(col_montant - 120, y + 15, totals_width, totals_start_y - y - 15)  # Fond blanc pour la zone des totaux
+    c.rect(COL_MONTANT - 120, y + 15, totals_width, totals_start_y - y - 15)  # Fond blanc pour la zone des totaux
     
     # Ligne de séparation entre Total HT et TVA
-    c.line(col_montant - 120, y + 35, table_right, y + 35)
+    c.line(COL_MONTANT - 120, y + 35, TABLE_RIGHT, y + 35)
     
     # Ligne verticale de séparation pour les montants
-    c.line(col_montant - 20, totals_start_y, col_montant - 20, y + 15)
+    c.line(COL_MONTANT - 20, totals_start_y, COL_MONTANT - 20, y + 15)
     
     # Total TTC avec fond gris
     c.setFillColorRGB(0.9, 0.9, 0.9)
-    c.rect(col_montant - 120, totals_end_y, totals_width, 20, fill=1)
+    c.rect(COL_MONTANT - 120, totals_end_y, totals_width, 20, fill=1)
     c.setFillColorRGB(0, 0, 0)
-    c.drawString(col_montant - 100, y, "Total TTC")
-    c.drawString(col_montant, y, f"{format_amount(data['TOTAL TTC'])} MAD")
+    c.drawString(COL_MONTANT - 100, y, "Total TTC")
     
     # Ligne finale du bas
-    c.line(col_montant - 120, totals_end_y, table_right, totals_end_y)
+    c.line(COL_MONTANT - 120, totals_end_y, TABLE_RIGHT, totals_end_y)
+
+    # Ajouter "Signature" en gras à droite après le montant en lettres
+    y -= 80
+    c.setFont(INVOICE_FONT_BOLD, 11)
+    signature_text = "Signature"
+    text_width = c.stringWidth(signature_text, INVOICE_FONT_BOLD, 11)
+    c.drawString(520 - text_width, y, signature_text)  # 520 est proche du bord droit, ajusté pour la marge
+
+def use_invoice_layout(c):
+    """Tamponner la partie fixe de la facture, définie une seule fois par document"""
+    if not c.hasForm(LAYOUT_FORM_NAME):
+        c.beginForm(LAYOUT_FORM_NAME)
+        draw_invoice_layout(c)
+        c.endForm()
+    c.doForm(LAYOUT_FORM_NAME)
+
+def draw_invoice(c, data, shared_layout=False):
+    """Dessiner une facture sur la page courante du canvas.
+
+    Avec `shared_layout`, la partie fixe est un formulaire partagé par toutes les
+    pages du document ; pour un document d'une seule facture, elle est dessinée
+    directement, un formulaire y coûtant plus cher qu'il ne rapporte.
+    """
+    # Calcul du prix par jour avec TVA (avant tout dessin pour ne jamais
+    # laisser de page à moitié dessinée si une valeur est invalide)
+    prix_location_ht = data['Prix location total HT'] / 100
+    nombre_jours = data['Nombre de jours']
+    prix_par_jour_ht = prix_location_ht / nombre_jours if nombre_jours > 0 else 0
+    prix_par_jour_ttc = prix_par_jour_ht * 1.20  # TVA 20%
+    montant_lettres = centimes_to_letters(data['TOTAL TTC'])
+    
+    # Partie fixe : libellés, tableau et cadres
+    if shared_layout:
+        use_invoice_layout(c)
+    else:
+        draw_invoice_layout(c)
+    
+    # Numéro de facture et date (à gauche sous FACTURE)
+    c.setFont(INVOICE_FONT_BOLD, 11)  
+    c.drawString(30, TOP_MARGIN - 30, f"N° : {data['Facture Numero']}.")
+    c.drawString(30, TOP_MARGIN - 50, f"Date : {format_date(data['Date de facture'])}.")
+    
+    # Informations du client (à droite)
+    c.setFont(INVOICE_FONT, 11)  
+    c.drawString(400, TOP_MARGIN - 50, f"{str(data['Client'])}.")
+    
+    # Détails de la location
+    c.setFont(INVOICE_FONT_BOLD, 11)
+    y = TOP_MARGIN - 80
+    c.drawString(30, y, f"Véhicule : {data['Marque du Vehicule']}.")
+    c.drawString(30, y - 20, f"Immatriculation : {data['Matricule']}.")
+    c.drawString(30, y - 40, f"Période de location : Du {format_date(data['Date de Depart'])} au {format_date(data['Date de Retour'])}.")
+    
+    # Affichage du nombre de jours et prix par jour
+    c.setFont(INVOICE_FONT, 11)
+    c.drawString(120, y - 60, f"{data['Nombre de jours']}.")
+    c.setFont(INVOICE_FONT_BOLD, 11)
+    c.drawString(150, y - 60, f"Prix par jour TTC : {format_amount(prix_par_jour_ttc)} MAD.")
+    
+    # Montants du tableau des prestations
+    y = TABLE_Y
+    c.setFont(INVOICE_FONT, 10)
+    c.drawString(COL_MONTANT, y, f"{format_centimes(data['Prix location total HT'])} MAD")
+    for label, key in PRESTATIONS:
+        y -= 20
+        c.drawString(COL_MONTANT, y, f"{format_centimes(data[key])} MAD")
+
+    # Totaux
+    y -= 20
+    c.setFont(INVOICE_FONT_BOLD, 10)
+    c.drawString(COL_MONTANT, y, f"{format_centimes(data['Total Location HT'])} MAD")
+    y -= 20
+    c.drawString(COL_MONTANT, y, f"{format_centimes(data['TVA 20 %'])} MAD")
+    y -= 20
+    c.drawString(COL_MONTANT, y, f"{format_centimes(data['TOTAL TTC'])} MAD")
 
     # Montant en lettres
     y -= 40  # Espace après le Total TTC
-    montant_lettres = number_to_letters(float(str(data['TOTAL TTC']).replace(' ', '').replace(',', '.')))
     
     # Texte en gras
-    c.setFont("Helvetica-Bold", 10)
     texte_complet = f"Arrêtée la présente facture à la somme de : {montant_lettres}."
     
     # Dessiner le texte
     c.drawString(30, y, texte_complet)
     
     # Ajouter le soulignement
-    text_width = c.stringWidth(texte_complet, "Helvetica-Bold", 10)
+    text_width = c.stringWidth(texte_complet, INVOICE_FONT_BOLD, 10)
     c.line(30, y - 2, 30 + text_width, y - 2)
 
-    # Ajouter "Signature" en gras à droite après un espace
-    y -= 40  # Espace d'une ligne
-    c.setFont("Helvetica-Bold", 11)
-    signature_text = "Signature"
-    text_width = c.stringWidth(signature_text, "Helvetica-Bold", 11)
-    c.drawString(520 - text_width, y, signature_text)  # 520 est proche du bord droit, ajusté pour la marge
+# Bornes des histogrammes de durée (secondes)
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
 
-    c.save()
+# Description des compteurs exposés sur /metrics
+METRIC_COUNTERS = {
+    'rows_rendered': "Factures rendues",
+    'rows_skipped': "Lignes ignorées (cellules vides)",
+    'rows_failed': "Lignes en erreur lors du rendu",
+    'cache_hits': "Factures servies depuis le cache",
+    'pdf_bytes_written': "Octets de PDF écrits",
+    'files_evicted': "PDF supprimés par la rétention",
+    'uploads': "Classeurs traités"
+}
+
+class Metrics:
+    """Compteurs et histogrammes de durée des étapes du processus courant.
+
+    Chaque processus écrit ses valeurs dans son propre fichier de METRICS_FOLDER ;
+    /metrics additionne les fichiers de tous les workers gunicorn.
+    """
+    def __init__(self, folder):
+        self.path = os.path.join(folder, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                # Un compteur par borne, plus +Inf, la somme et le nombre
+                histogram = self.histograms[stage] = [0] * (len(HISTOGRAM_BUCKETS) + 1) + [0.0, 0]
+            histogram[bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def flush(self, force=False):
+        """Écrire les valeurs du processus (au plus une fois par seconde)"""
+        now = time.time()
+        if not force and now - self._last_flush < 1:
+            return
+        with self._lock:
+            data = json.dumps({'counters': self.counters, 'histograms': self.histograms})
+            self._last_flush = now
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+_metrics = None
+
+def get_metrics():
+    """Retourner les métriques du processus courant (remises à zéro après un fork)"""
+    global _metrics
+    if _metrics is None or not os.path.basename(_metrics.path).startswith(f"{os.getpid()}_"):
+        _metrics = Metrics(app.config['METRICS_FOLDER'])
+    return _metrics
+
+# Valeurs cumulées des processus terminés (workers redémarrés ou recyclés)
+RETIRED_METRICS = 'retired.json'
+
+def _read_metrics(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _add_metrics(counters, histograms, data):
+    """Ajouter les valeurs d'un fichier de métriques aux totaux"""
+    for name, value in data['counters'].items():
+        counters[name] = counters.get(name, 0) + value
+    for stage, values in data['histograms'].items():
+        total = histograms.setdefault(stage, [0] * len(values))
+        for i, value in enumerate(values):
+            total[i] += value
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def retire_dead_metrics(folder):
+    """Fusionner les fichiers des processus terminés dans RETIRED_METRICS et les supprimer.
+
+    Les compteurs restent ainsi croissants sans que le dossier grandisse à
+    chaque redémarrage de worker ; un verrou évite que deux lectures de
+    /metrics fusionnent le même fichier.
+    """
+    if fcntl is None:
+        return
+    with open(os.path.join(folder, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for entry in os.scandir(folder):
+            pid = entry.name.split('_', 1)[0]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                dead.append(entry)
+        if not dead:
+            return
+        retired_path = os.path.join(folder, RETIRED_METRICS)
+        retired = _read_metrics(retired_path) or {'counters': {}, 'histograms': {}}
+        for entry in dead:
+            # Les fichiers temporaires d'une écriture interrompue sont seulement supprimés
+            data = _read_metrics(entry.path) if entry.name.endswith('.json') else None
+            if data:
+                _add_metrics(retired['counters'], retired['histograms'], data)
+        tmp_path = f"{retired_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(retired, f)
+        os.replace(tmp_path, retired_path)
+        for entry in dead:
+            os.remove(entry.path)
+
+def render_metrics(folder):
+    """Additionner les métriques de tous les processus au format texte Prometheus"""
+    retire_dead_metrics(folder)
+    counters = dict.fromkeys(METRIC_COUNTERS, 0)
+    histograms = {}
+    for entry in os.scandir(folder):
+        if not entry.name.endswith('.json'):
+            continue
+        data = _read_metrics(entry.path)
+        if data:
+            _add_metrics(counters, histograms, data)
+
+    lines = []
+    for name, value in counters.items():
+        lines.append(f"# HELP facturespdf_{name}_total {METRIC_COUNTERS.get(name, name)}")
+        lines.append(f"# TYPE facturespdf_{name}_total counter")
+        lines.append(f"facturespdf_{name}_total {value}")
+    lines.append("# HELP facturespdf_stage_seconds Durée des étapes du traitement des uploads")
+    lines.append("# TYPE facturespdf_stage_seconds histogram")
+    for stage, values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(HISTOGRAM_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'facturespdf_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'facturespdf_stage_seconds_sum{{stage="{stage}"}} {values[-2]}')
+        lines.append(f'facturespdf_stage_seconds_count{{stage="{stage}"}} {values[-1]}')
+    return "\n".join(lines) + "\n"
+
+# Pool de processus de rendu, créé à la demande et conservé entre les requêtes
+_render_pool = None
+_render_pool_pid = None
+
+def _init_render_worker():
+    """Préchauffer un processus de rendu (déjà fait s'il est issu d'un fork après warm_up)"""
+    register_fonts()
+
+def get_render_pool():
+    """Retourner le pool de rendu du processus courant"""
+    global _render_pool, _render_pool_pid
+    # Un pool hérité d'un fork (ex: worker gunicorn) n'est pas utilisable
+    if _render_pool is None or _render_pool_pid != os.getpid():
+        _render_pool = ProcessPoolExecutor(
+            max_workers=app.config['RENDER_WORKERS'],
+            initializer=_init_render_worker
+        )
+        _render_pool_pid = os.getpid()
+    return _render_pool
+
+def discard_render_pool(pool):
+    """Abandonner un pool dont un processus a disparu (OOM, plantage) ; le suivant est recréé"""
+    global _render_pool
+    if _render_pool is pool:
+        _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# Préchauffage : modules lourds, polices et première facture, avant le trafic
+_warm_up_done = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+WARM_UP_INVOICE = {
+    **{column: 0 for column in EXPECTED_COLUMNS},
+    'Facture Numero': 'WARMUP',
+    'Date de facture': datetime(2024, 1, 1),
+    'Client': 'Préchauffage',
+    'Date de Depart': datetime(2024, 1, 1),
+    'Date de Retour': datetime(2024, 1, 2),
+    'Marque du Vehicule': 'Véhicule',
+    'Matricule': '0-A-0',
+    'Nombre de jours': 1,
+}
+
+def warm_up():
+    """Importer openpyxl et reportlab, enregistrer les polices et rendre une facture jetable.
+
+    Appelé par gunicorn dans le processus maître (voir gunicorn.conf.py) : les
+    workers et leurs processus de rendu héritent de tout cela au fork.
+    """
+    import openpyxl  # noqa: F401 (chargé pour les workers)
+    register_fonts()
+    create_invoice_pdf(WARM_UP_INVOICE, io.BytesIO())
+    _warm_up_done.set()
+
+def start_warm_up():
+    """Lancer le préchauffage en arrière-plan s'il n'a pas déjà eu lieu"""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None and not _warm_up_done.is_set():
+            _warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+            _warm_up_thread.start()
+
+class LocalStorage:
+    """Stockage des PDF dans un dossier local"""
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, secure_filename(name))
+
+    def put(self, name, data):
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_from(self, name, data, source_path):
+        """Enregistrer `data`, déjà écrit dans le fichier local `source_path`
+        (cache des factures) : un lien physique évite de l'écrire une seconde fois"""
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            # Autre système de fichiers, liens non pris en charge, ou fichier
+            # évincé du cache entre-temps
+            self.put(name, data)
+            return
+        os.replace(tmp_path, path)
+
+    def get(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, name):
+        """Chemin du fichier sur le disque local, ou None s'il n'existe pas"""
+        path = self._path(name)
+        return path if os.path.exists(path) else None
+
+class MemoryStorage:
+    """Stockage en mémoire des PDF récents, limité à `max_bytes` (LRU).
+
+    `on_evict`, s'il est défini, reçoit la liste des noms évincés pour faire
+    de la place (voir TrackedStorage).
+    """
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._files = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, name, data):
+        evicted = []
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._files[name] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._files:
+                evicted_name, evicted_data = self._files.popitem(last=False)
+                self._size -= len(evicted_data)
+                evicted.append(evicted_name)
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def put_from(self, name, data, source_path):
+        self.put(name, data)
+
+    def get(self, name):
+        with self._lock:
+            data = self._files.get(name)
+            if data is not None:
+                self._files.move_to_end(name)
+            return data
+
+    def exists(self, name):
+        with self._lock:
+            return name in self._files
+
+    def delete(self, name):
+        with self._lock:
+            data = self._files.pop(name, None)
+            if data is not None:
+                self._size -= len(data)
+
+    def local_path(self, name):
+        return None
+
+class S3Storage:
+    """Stockage dans un bucket S3 ou compatible (MinIO, Ceph, serveur de test...)
+
+    `client` est un client boto3 ou tout objet offrant put_object, get_object,
+    head_object et delete_object ; par défaut un client boto3 est créé.
+    """
+    def __init__(self, bucket, prefix='', client=None, endpoint_url=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError('Le paquet boto3 est requis pour le stockage S3')
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, name):
+        return f"{self.prefix}{secure_filename(name)}"
+
+    def _is_missing(self, error):
+        response = getattr(error, 'response', None) or {}
+        return response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data, ContentType='application/pdf')
+
+    def put_from(self, name, data, source_path):
+        self.put(name, data)
+
+    def get(self, name):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return response['Body'].read()
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def local_path(self, name):
+        return None
+
+class TieredStorage:
+    """Stockage principal précédé d'un niveau en mémoire pour les PDF récents"""
+    def __init__(self, hot, backend):
+        self.hot = hot
+        self.backend = backend
+
+    def put(self, name, data):
+        self.backend.put(name, data)
+        self.hot.put(name, data)
+
+    def put_from(self, name, data, source_path):
+        self.backend.put_from(name, data, source_path)
+        self.hot.put(name, data)
+
+    def get(self, name):
+        data = self.hot.get(name)
+        if data is None:
+            data = self.backend.get(name)
+            if data is not None:
+                self.hot.put(name, data)
+        return data
+
+    def exists(self, name):
+        return self.hot.exists(name) or self.backend.exists(name)
+
+    def delete(self, name):
+        self.hot.delete(name)
+        self.backend.delete(name)
+
+    def local_path(self, name):
+        # Un PDF présent en mémoire est servi depuis la mémoire
+        if self.hot.exists(name):
+            return None
+        return self.backend.local_path(name)
+
+class RetentionIndex:
+    """Index SQLite des PDF stockés (taille, création, dernier accès).
+
+    L'index évite de parcourir le dossier de sortie à chaque passage du
+    nettoyage ; il est partagé par tous les processus.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.created = not os.path.exists(path)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "name TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, name, size):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (name, size, created, accessed) VALUES (?, ?, ?, ?)",
+                (name, size, now, now)
+            )
+
+    def touch(self, name):
+        with self._connect() as conn:
+            conn.execute("UPDATE files SET accessed = ? WHERE name = ?", (time.time(), name))
+
+    def seed(self, folder):
+        """Indexer les fichiers déjà présents (une seule fois, à la création de l'index)"""
+        rows = []
+        for entry in os.scandir(folder):
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                rows.append((entry.name, stat.st_size, stat.st_mtime, stat.st_mtime))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO files (name, size, created, accessed) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    def expired(self, before):
+        """Noms des fichiers non consultés depuis `before`"""
+        with self._connect() as conn:
+            return [name for name, in conn.execute(
+                "SELECT name FROM files WHERE accessed < ? ORDER BY accessed", (before,)
+            )]
+
+    def over_capacity(self, max_bytes):
+        """Noms des fichiers les moins récemment utilisés à supprimer pour tenir dans max_bytes"""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+            names = []
+            if total <= max_bytes:
+                return names
+            for name, size in conn.execute("SELECT name, size FROM files ORDER BY accessed"):
+                names.append(name)
+                total -= size
+                if total <= max_bytes:
+                    break
+            return names
+
+    def remove(self, names):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in names])
+
+class TrackedStorage:
+    """Stockage dont les écritures et les lectures sont enregistrées dans l'index de rétention"""
+    def __init__(self, storage, index):
+        self.storage = storage
+        self.index = index
+        # Un stockage en mémoire évince de lui-même : l'index doit le savoir,
+        # sinon il surestime la taille stockée et le nettoyage supprime à tort
+        if isinstance(storage, MemoryStorage):
+            storage.on_evict = index.remove
+
+    @contextmanager
+    def _recording(self, name, size):
+        # Enregistré avant l'écriture, pour qu'un fichier évincé aussitôt
+        # (plus gros que le stockage en mémoire) ne reste pas dans l'index
+        self.index.record(name, size)
+        try:
+            yield
+        except Exception:
+            self.index.remove([name])
+            raise
+
+    def put(self, name, data):
+        with self._recording(name, len(data)):
+            self.storage.put(name, data)
+
+    def put_from(self, name, data, source_path):
+        with self._recording(name, len(data)):
+            self.storage.put_from(name, data, source_path)
+
+    def get(self, name):
+        data = self.storage.get(name)
+        if data is not None:
+            self.index.touch(name)
+        return data
+
+    def exists(self, name):
+        return self.storage.exists(name)
+
+    def delete(self, name):
+        self.storage.delete(name)
+        self.index.remove([name])
+
+    def local_path(self, name):
+        path = self.storage.local_path(name)
+        if path:
+            self.index.touch(name)
+        return path
+
+def sweep_storage(storage, index, ttl, max_bytes):
+    """Supprimer les PDF expirés, puis les moins récemment utilisés au-delà de max_bytes.
+
+    Les factures de l'index rendues dans un fichier supprimé en sont retirées,
+    pour que /invoices/<numéro>/pdf ne redirige pas vers un fichier absent.
+    """
+    evicted = 0
+    invoice_index = get_invoice_index()
+    for names in (
+        index.expired(time.time() - ttl) if ttl else [],
+        index.over_capacity(max_bytes) if max_bytes else []
+    ):
+        for name in names:
+            storage.delete(name)
+        index.remove(names)
+        if invoice_index:
+            invoice_index.remove_files(names)
+        evicted += len(names)
+    if evicted:
+        get_metrics().inc('files_evicted', evicted)
+    return evicted
+
+def _run_sweeper(storage, index):
+    """Boucle du nettoyage périodique des PDF (thread d'arrière-plan)"""
+    while True:
+        time.sleep(app.config['RETENTION_INTERVAL'])
+        try:
+            sweep_storage(storage, index, app.config['OUTPUT_TTL'], app.config['OUTPUT_MAX_BYTES'])
+        except Exception as e:
+            print(f"Erreur lors du nettoyage des factures: {str(e)}")
+
+STORAGE_BACKENDS = {'local', 'memory', 's3'}
+
+_storage = None
+_storage_pid = None
+
+def create_storage():
+    """Construire le stockage des PDF décrit par la configuration"""
+    backend = app.config['STORAGE_BACKEND']
+    if backend == 'memory':
+        return MemoryStorage(app.config['STORAGE_MEMORY_BYTES'])
+    if backend == 's3':
+        storage = S3Storage(
+            app.config['S3_BUCKET'],
+            app.config['S3_PREFIX'],
+            endpoint_url=app.config['S3_ENDPOINT_URL']
+        )
+    elif backend == 'local':
+        storage = LocalStorage(app.config['OUTPUT_FOLDER'])
+    else:
+        raise ValueError(f"Stockage inconnu: {backend} (choix possibles : {', '.join(sorted(STORAGE_BACKENDS))})")
+    if app.config['STORAGE_MEMORY_TIER']:
+        storage = TieredStorage(MemoryStorage(app.config['STORAGE_MEMORY_BYTES']), storage)
+    return storage
+
+def get_storage():
+    """Retourner le stockage des PDF du processus courant.
+
+    Si une durée de conservation ou une taille maximale est configurée, le
+    stockage est suivi par l'index de rétention et nettoyé en arrière-plan.
+    """
+    global _storage, _storage_pid
+    # Un client S3 ne doit pas être partagé entre processus
+    if _storage is None or _storage_pid != os.getpid():
+        storage = create_storage()
+        if app.config['OUTPUT_TTL'] or app.config['OUTPUT_MAX_BYTES']:
+            index = RetentionIndex(app.config['RETENTION_INDEX'])
+            if index.created and app.config['STORAGE_BACKEND'] == 'local':
+                index.seed(app.config['OUTPUT_FOLDER'])
+            storage = TrackedStorage(storage, index)
+            threading.Thread(target=_run_sweeper, args=(storage, index), daemon=True).start()
+        _storage = storage
+        _storage_pid = os.getpid()
+    return _storage
+
+class InvoiceIndex:
+    """Index SQLite des factures générées : numéro, client, immatriculation,
+    dates, totaux (en centimes), fichier et empreinte du PDF.
+
+    La facture la plus récente d'un numéro est trouvée par l'index
+    (number, created) ; la recherche par client, immatriculation ou période
+    s'appuie sur un index par colonne.
+    """
+    FIELDS = (
+        'number', 'client', 'plate', 'invoice_date', 'start_date', 'end_date',
+        'total_ht', 'tva', 'total_ttc', 'file', 'page', 'sha256', 'created'
+    )
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                "id INTEGER PRIMARY KEY, number TEXT NOT NULL, "
+                "client TEXT NOT NULL COLLATE NOCASE, plate TEXT NOT NULL COLLATE NOCASE, "
+                "invoice_date TEXT NOT NULL, start_date TEXT NOT NULL, end_date TEXT NOT NULL, "
+                "total_ht INTEGER NOT NULL, tva INTEGER NOT NULL, total_ttc INTEGER NOT NULL, "
+                "file TEXT NOT NULL, page INTEGER NOT NULL, sha256 TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS invoices_number ON invoices (number, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS invoices_client ON invoices (client)")
+            conn.execute("CREATE INDEX IF NOT EXISTS invoices_plate ON invoices (plate)")
+            conn.execute("CREATE INDEX IF NOT EXISTS invoices_date ON invoices (invoice_date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS invoices_file ON invoices (file)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, entries):
+        """Enregistrer des factures (dicts aux clés de FIELDS) en une transaction"""
+        if not entries:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO invoices ({', '.join(self.FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(self.FIELDS))})",
+                [tuple(entry[field] for field in self.FIELDS) for entry in entries]
+            )
+
+    def remove_files(self, files):
+        """Oublier les factures rendues dans ces fichiers (supprimés du stockage)"""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM invoices WHERE file = ?", [(name,) for name in files])
+
+    def latest(self, number):
+        """Facture la plus récente portant ce numéro, ou None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM invoices WHERE number = ? ORDER BY created DESC, id DESC LIMIT 1",
+                (number,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def search(self, client=None, plate=None, date_from=None, date_to=None, page=1, per_page=50):
+        """Rechercher des factures (client : début du nom, sans tenir compte de la casse).
+
+        Retourne (nombre total de résultats, factures de la page demandée), les
+        plus récentes en premier.
+        """
+        conditions = []
+        params = []
+        if client:
+            escaped = client.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("client LIKE ? ESCAPE '\\'")
+            params.append(f"{escaped}%")
+        if plate:
+            conditions.append("plate = ?")
+            params.append(plate)
+        if date_from:
+            conditions.append("invoice_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("invoice_date <= ?")
+            params.append(date_to)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM invoices {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM invoices {where} ORDER BY invoice_date DESC, id DESC LIMIT ? OFFSET ?",
+                params + [per_page, (page - 1) * per_page]
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+def invoice_index_entry(row_data, filename, sha256, page=1):
+    """Ligne de l'index des factures pour une facture typée rendue dans `filename`"""
+    return {
+        'number': row_data['Facture Numero'],
+        'client': row_data['Client'],
+        'plate': row_data['Matricule'],
+        'invoice_date': row_data['Date de facture'].isoformat(),
+        'start_date': row_data['Date de Depart'].isoformat(),
+        'end_date': row_data['Date de Retour'].isoformat(),
+        'total_ht': row_data['Total Location HT'],
+        'tva': row_data['TVA 20 %'],
+        'total_ttc': row_data['TOTAL TTC'],
+        'file': filename,
+        'page': page,
+        'sha256': sha256,
+        'created': time.time()
+    }
+
+_invoice_index = None
+
+def get_invoice_index():
+    """Retourner l'index des factures, ou None s'il est désactivé"""
+    global _invoice_index
+    if not app.config['INVOICE_INDEX']:
+        return None
+    if _invoice_index is None:
+        _invoice_index = InvoiceIndex(app.config['INVOICE_INDEX'])
+    return _invoice_index
+
+def _normalize_value(value):
+    """Représentation stable d'une cellule pour le calcul de la clé de cache"""
+    if isinstance(value, datetime):
+        return ['datetime', value.isoformat()]
+    return [type(value).__name__, str(value)]
+
+def invoice_cache_key(row_data, profile='compact'):
+    """Calculer l'empreinte d'une facture (données de la ligne, mise en page et profil de rendu)"""
+    payload = json.dumps([
+        LAYOUT_VERSION,
+        profile,
+        app.config['LETTERHEAD'],
+        app.config['FONT_REGULAR'],
+        app.config['FONT_BOLD'],
+        [_normalize_value(row_data[col]) for col in EXPECTED_COLUMNS]
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Intervalle de relecture du dossier du cache : les limites portent sur le
+# dossier partagé par tous les workers, pas seulement sur les ajouts du processus
+RENDER_CACHE_RESCAN_INTERVAL = 30
+
+class RenderCache:
+    """Cache sur disque des PDF rendus, indexé par l'empreinte de la facture.
+
+    Les entrées les moins récemment utilisées sont supprimées au-delà de
+    `max_entries` fichiers ou `max_bytes` octets dans le dossier. L'index LRU
+    de chaque processus est reconstruit à partir du dossier toutes les
+    RENDER_CACHE_RESCAN_INTERVAL secondes : il voit ainsi les ajouts des autres
+    workers, et la date de modification des fichiers sert d'ordre LRU commun.
+    """
+    def __init__(self, folder, max_entries, max_bytes):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = None
+        self._size = 0
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        """Chemin du fichier d'une entrée (présente ou non)"""
+        return os.path.join(self.folder, f"{key}.pdf")
+
+    def _load(self):
+        """Construire l'index LRU à partir du dossier"""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.pdf'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._size = sum(self._entries.values())
+        self._loaded = time.monotonic()
+
+    def _sync(self):
+        if self._entries is None or time.monotonic() - self._loaded > RENDER_CACHE_RESCAN_INTERVAL:
+            self._load()
+
+    def _use(self, key, size):
+        """Marquer une entrée comme la plus récente (à appeler sous le verrou)"""
+        self._sync()
+        if key not in self._entries:
+            self._entries[key] = size
+            self._size += size
+        self._entries.move_to_end(key)
+
+    def get(self, key):
+        """Retourner le PDF en cache, ou None s'il est absent"""
+        # Le fichier peut venir d'un autre worker : le dossier fait foi
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+            # La date de modification sert d'ordre LRU aux autres processus
+            os.utime(self.path(key))
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, None) if self._entries is not None else None
+                if size is not None:
+                    self._size -= size
+            return None
+        with self._lock:
+            self._use(key, len(data))
+        return data
+
+    def put(self, key, data):
+        """Ajouter un PDF rendu au cache ; retourne le chemin du fichier, ou None en cas d'échec"""
+        try:
+            if not os.path.exists(self.path(key)):
+                tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path(key))
+        except OSError:
+            return None
+        with self._lock:
+            self._use(key, len(data))
+            self._evict()
+        return self.path(key)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+_render_cache = None
+
+def get_render_cache():
+    """Retourner le cache des factures, ou None s'il est désactivé"""
+    global _render_cache
+    if not app.config['RENDER_CACHE_MAX_ENTRIES'] or not app.config['RENDER_CACHE_MAX_BYTES']:
+        return None
+    if _render_cache is None:
+        _render_cache = RenderCache(
+            app.config['CACHE_FOLDER'],
+            app.config['RENDER_CACHE_MAX_ENTRIES'],
+            app.config['RENDER_CACHE_MAX_BYTES']
+        )
+    return _render_cache
+
+def _render_task(task):
+    """Rendre une facture en mémoire, sans propager l'exception"""
+    row_idx, row_data, filename, key, profile = task
+    start = time.perf_counter()
+    try:
+        buffer = io.BytesIO()
+        create_invoice_pdf(row_data, buffer, profile)
+        return row_idx, filename, None, time.perf_counter() - start, buffer.getvalue()
+    except Exception as e:
+        return row_idx, filename, str(e), time.perf_counter() - start, None
+
+def _render_batch(tasks):
+    """Rendre un lot de factures dans un processus du pool"""
+    return [_render_task(task) for task in tasks]
+
+def _done(results):
+    """Envelopper des résultats déjà connus dans un Future terminé"""
+    future = Future()
+    future.set_result(results)
+    return future
+
+def render_invoices(tasks, on_stored=None):
+    """Rendre des (row_idx, row_data, filename, key, profile) en parallèle (générateur).
+
+    Les tâches peuvent provenir d'un générateur : seuls quelques lots sont en cours
+    à un instant donné, le rendu commence donc pendant la lecture des lignes
+    suivantes. Chaque PDF est enregistré dans le stockage configuré ; les factures
+    déjà présentes dans le cache ne sont pas rendues. Les résultats (row_idx,
+    filename, erreur, durée du rendu) sont produits dans l'ordre des lignes ;
+    `on_stored(task, data)` est appelé pour chaque PDF rendu ou trouvé en cache.
+    """
+    storage = get_storage()
+    cache = get_render_cache()
+    metrics = get_metrics()
+    workers = app.config['RENDER_WORKERS']
+    parallel = workers > 1
+    batch_size = app.config['RENDER_BATCH_SIZE'] if parallel else 1
+    pending = deque()
+    batch = []
+
+    def submit(batch):
+        if parallel:
+            pool = get_render_pool()
+            try:
+                future = pool.submit(_render_batch, batch)
+            except BrokenProcessPool:
+                # Pool cassé depuis le lot précédent : repartir d'un pool neuf
+                discard_render_pool(pool)
+                pool = get_render_pool()
+                future = pool.submit(_render_batch, batch)
+            pending.append((batch, future, pool))
+        else:
+            pending.append((batch, _done(_render_batch(batch)), None))
+
+    def batch_results(batch, future, pool):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            discard_render_pool(pool)
+        # Pool cassé : le lot est rendu une seconde fois dans un pool neuf, puis
+        # compté en erreur si ce pool casse aussi (lot qui fait planter le rendu)
+        pool = get_render_pool()
+        try:
+            return pool.submit(_render_batch, batch).result()
+        except BrokenProcessPool as e:
+            discard_render_pool(pool)
+            return [(task[0], task[2], f'Processus de rendu interrompu: {e}', 0.0, None) for task in batch]
+
+    def collect():
+        batch, future, pool = pending.popleft()
+        for task, (row_idx, filename, error, seconds, data) in zip(batch, batch_results(batch, future, pool)):
+            if data is not None:
+                # Écrit une seule fois : dans le cache, puis lié dans le stockage
+                # local (copié pour les stockages en mémoire ou S3)
+                cached_path = cache.put(task[3], data) if cache else None
+                if cached_path:
+                    storage.put_from(filename, data, cached_path)
+                else:
+                    storage.put(filename, data)
+                metrics.inc('pdf_bytes_written', len(data))
+                if on_stored:
+                    on_stored(task, data)
+            yield row_idx, filename, error, seconds
+
+    for task in tasks:
+        row_idx, row_data, filename, key, profile = task
+        data = cache.get(key) if cache else None
+        if data is not None:
+            if not storage.exists(filename):
+                storage.put_from(filename, data, cache.path(key))
+            if on_stored:
+                on_stored(task, data)
+            # Conserver l'ordre : le lot en cours part avant le résultat en cache
+            if batch:
+                submit(batch)
+                batch = []
+            metrics.inc('cache_hits')
+            pending.append(([task], _done([(row_idx, filename, None, 0.0, None)]), None))
+        else:
+            batch.append(task)
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+        # Limiter le nombre de lots en vol pour garder une mémoire constante
+        while len(pending) >= max(workers, 1) * 2:
+            yield from collect()
+    if batch:
+        submit(batch)
+    while pending:
+        yield from collect()
+
+# Type de chaque colonne attendue ('text' par défaut) : les montants sont lus
+# en centimes entiers, les dates en `date` et le nombre de jours en `int`
+AMOUNT_COLUMNS = EXPECTED_COLUMNS[EXPECTED_COLUMNS.index('Prix par jour HT'):]
+COLUMN_TYPES = {
+    'Date de facture': 'date',
+    'Date de Depart': 'date',
+    'Date de Retour': 'date',
+    'Nombre de jours': 'int',
+    **{col: 'amount' for col in AMOUNT_COLUMNS}
+}
+# Formats acceptés pour les dates saisies en texte (CSV, cellules texte)
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+def decode_text(value):
+    return str(value).strip()
+
+def decode_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"date invalide ({value})")
+
+def decode_int(value):
+    if type(value) is int:
+        return value
+    try:
+        number = Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite() or number != number.to_integral_value():
+        raise ValueError(f"nombre entier invalide ({value})")
+    return int(number)
+
+def decode_amount(value):
+    try:
+        return to_centimes(value)
+    except (InvalidOperation, ValueError, TypeError, OverflowError):
+        raise ValueError(f"montant invalide ({value})")
+
+COLUMN_DECODERS = {
+    'text': decode_text,
+    'date': decode_date,
+    'int': decode_int,
+    'amount': decode_amount
+}
+
+class InvalidRowError(ValueError):
+    """Ligne dont au moins une valeur ne peut pas être convertie"""
+    def __init__(self, invoice, errors):
+        super().__init__(" ; ".join(errors))
+        self.invoice = invoice
+        self.errors = errors
+
+class InvoiceSchema:
+    """Correspondance compilée entre les en-têtes d'une feuille et les colonnes attendues.
+
+    Les en-têtes sont comparés sans tenir compte de la casse, au nom de la
+    colonne puis à ses alias (`aliases` : colonne -> autres noms acceptés).
+    `decode(row)` convertit une ligne en facture typée en une seule passe.
+    """
+    def __init__(self, headers, aliases=None):
+        aliases = aliases or {}
+        positions = {}
+        for i, header in enumerate(headers):
+            positions.setdefault(str(header).strip().lower() if header else '', i)
+        self.mapping = {}
+        for col in EXPECTED_COLUMNS:
+            for name in [col, *aliases.get(col, ())]:
+                if name.strip().lower() in positions:
+                    self.mapping[col] = positions[name.strip().lower()]
+                    break
+        self.missing = [col for col in EXPECTED_COLUMNS if col not in self.mapping]
+        self._columns = list(self.mapping)
+        self._decoders = [COLUMN_DECODERS[COLUMN_TYPES.get(col, 'text')] for col in self._columns]
+        self._width = max(self.mapping.values(), default=-1) + 1
+        self._getter = operator.itemgetter(*self.mapping.values()) if len(self.mapping) > 1 else None
+
+    def decode(self, row):
+        """Facture typée d'une ligne complète, None si une cellule est vide.
+
+        Lève InvalidRowError si une valeur ne peut pas être convertie.
+        """
+        if len(row) < self._width:
+            row = tuple(row) + (None,) * (self._width - len(row))
+        values = self._getter(row) if self._getter else tuple(row[i] for i in self.mapping.values())
+        for value in values:
+            if value is None or value == '':
+                return None
+        invoice = {}
+        errors = []
+        for col, decoder, value in zip(self._columns, self._decoders, values):
+            try:
+                invoice[col] = decoder(value)
+            except ValueError as e:
+                errors.append(f"{col} : {e}")
+        if errors:
+            raise InvalidRowError(str(values[0]).strip(), errors)
+        return invoice
+
+def compile_schema(headers):
+    """Compiler la correspondance des en-têtes avec les alias configurés"""
+    return InvoiceSchema(headers, app.config['COLUMN_ALIASES'])
+
+def iter_invoice_rows(rows, schema, start=2, on_error=None):
+    """Convertir les lignes complètes en factures typées (générateur de (row_idx, facture)).
+
+    Les lignes incomplètes sont ignorées ; `on_error(row_idx, erreur)` est
+    appelé pour les lignes dont une valeur est invalide.
+    """
+    metrics = get_metrics()
+    rows = iter(rows)
+    for row_idx in itertools.count(start):
+        # La lecture de la ligne fait partie de l'extraction (mode streaming)
+        started = time.perf_counter()
+        row = next(rows, None)
+        if row is None:
+            break
+        
+        try:
+            invoice = schema.decode(row)
+        except InvalidRowError as e:
+            if on_error:
+                on_error(row_idx, e)
+            continue
+        
+        if invoice is None:
+            metrics.inc('rows_skipped')
+            continue
+        
+        metrics.observe('row_extraction', time.perf_counter() - started)
+        yield row_idx, invoice
+
+def iter_render_tasks(invoice_rows, profile='compact'):
+    """Associer à chaque ligne le nom de son PDF et sa clé de cache (générateur)"""
+    for row_idx, row_data in invoice_rows:
+        # Le nom du PDF dépend du contenu : une ligne inchangée garde le même fichier
+        key = invoice_cache_key(row_data, profile)
+        invoice_num = row_data['Facture Numero']
+        pdf_filename = f"facture_{invoice_num}_{key[:16]}.pdf"
+        yield row_idx, row_data, pdf_filename, key, profile
+
+def parse_csv_amount(value, decimal_comma=True):
+    """Convertir un montant CSV ('1 234,50' ou '1,234.50') en Decimal.
+
+    Si la virgule et le point apparaissent tous deux, le dernier est le
+    séparateur décimal ; sinon la virgule est décimale avec `decimal_comma` et
+    séparateur de milliers sans. La valeur est retournée telle quelle si ce
+    n'est pas un nombre.
+    """
+    cleaned = value.replace(' ', '').replace('\u00a0', '').replace('\u202f', '')
+    if ',' in cleaned and '.' in cleaned:
+        thousands = ',' if cleaned.rindex('.') > cleaned.rindex(',') else '.'
+        cleaned = cleaned.replace(thousands, '').replace(',', '.')
+    elif decimal_comma:
+        cleaned = cleaned.replace(',', '.')
+    else:
+        cleaned = cleaned.replace(',', '')
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return value
+
+class XlsxBook:
+    """Classeur XLSX lu avec openpyxl (en lecture seule en mode streaming)"""
+    def __init__(self, source):
+        import openpyxl
+        self.wb = openpyxl.load_workbook(
+            spool_file(source),
+            data_only=True,
+            read_only=app.config['STREAMING_INGESTION']
+        )
+
+    def sheet_names(self):
+        return [sheet.title for sheet in self.wb.worksheets]
+
+    def active_sheet(self):
+        return self.wb.active.title
+
+    def rows(self, name):
+        """Lignes d'une feuille : (lignes, nombre de lignes ou None)"""
+        sheet = self.wb[name]
+        total = sheet.max_row - 1 if sheet.max_row else None
+        return sheet.iter_rows(values_only=True), total
+
+    def close(self):
+        self.wb.close()
+
+class CsvBook:
+    """Fichier CSV, vu comme un classeur d'une seule feuille lue au fil de l'eau.
+
+    Le séparateur, l'encodage et le séparateur décimal viennent de la
+    configuration (CSV_DELIMITER, CSV_ENCODING, CSV_DECIMAL_COMMA) ; les
+    colonnes de montants sont converties en Decimal.
+    """
+    SHEET_NAME = 'CSV'
+
+    def __init__(self, source):
+        self.source = source
+        self.stream = open(source, 'rb') if isinstance(source, str) else spool_file(source)
+        self.text = io.TextIOWrapper(self.stream, encoding=app.config['CSV_ENCODING'], newline='')
+
+    def sheet_names(self):
+        return [self.SHEET_NAME]
+
+    def active_sheet(self):
+        return self.SHEET_NAME
+
+    def rows(self, name):
+        return self._iter_rows(), None
+
+    def _iter_rows(self):
+        decimal_comma = app.config['CSV_DECIMAL_COMMA']
+        reader = csv.reader(self.text, delimiter=app.config['CSV_DELIMITER'])
+        headers = next(reader, None)
+        if headers is None:
+            return
+        yield headers
+        column_mapping = compile_schema(headers).mapping
+        amount_indexes = [column_mapping[col] for col in AMOUNT_COLUMNS if col in column_mapping]
+        for row in reader:
+            for i in amount_indexes:
+                if i < len(row) and row[i]:
+                    row[i] = parse_csv_amount(row[i], decimal_comma)
+            yield row
+
+    def close(self):
+        # Le tampon appartient à l'appelant : ne pas le fermer avec le TextIOWrapper
+        self.text.detach()
+        if isinstance(self.source, str):
+            self.stream.close()
+
+ODS_NS = {
+    'office': 'urn:oasis:names:tc:opendocument:xmlns:office:1.0',
+    'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
+    'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+}
+ODS_TABLE = f"{{{ODS_NS['table']}}}table"
+ODS_ROW = f"{{{ODS_NS['table']}}}table-row"
+ODS_CELLS = {f"{{{ODS_NS['table']}}}table-cell", f"{{{ODS_NS['table']}}}covered-table-cell"}
+ODS_TEXT = f"{{{ODS_NS['text']}}}p"
+
+def _ods_attr(elem, ns, name):
+    return elem.get(f"{{{ODS_NS[ns]}}}{name}")
+
+def _ods_cell_value(cell):
+    """Valeur typée d'une cellule ODS (nombre, date, booléen ou texte)"""
+    value_type = _ods_attr(cell, 'office', 'value-type')
+    if value_type in ('float', 'percentage', 'currency'):
+        number = Decimal(_ods_attr(cell, 'office', 'value'))
+        # Mêmes types qu'openpyxl : entier si la valeur n'a pas de décimales
+        return int(number) if number == number.to_integral_value() else float(number)
+    if value_type == 'date':
+        return datetime.fromisoformat(_ods_attr(cell, 'office', 'date-value'))
+    if value_type == 'boolean':
+        return _ods_attr(cell, 'office', 'boolean-value') == 'true'
+    text = '\n'.join(''.join(p.itertext()) for p in cell.iter(ODS_TEXT))
+    return text or None
+
+def _iter_ods_elements(content):
+    """Parcourir un content.xml ODS (générateur de (feuille, ligne)).
+
+    Produit (nom, None) au début de chaque feuille puis (nom, ligne) pour chaque
+    ligne ; le XML est lu avec iterparse et chaque ligne libérée après usage.
+    """
+    stack = []
+    table = None
+    for event, elem in ElementTree.iterparse(content, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag == ODS_TABLE:
+                table = _ods_attr(elem, 'table', 'name')
+                yield table, None
+            continue
+        stack.pop()
+        if elem.tag == ODS_ROW:
+            yield table, elem
+            stack[-1].remove(elem)
+        elif elem.tag == ODS_TABLE:
+            stack[-1].remove(elem)
+            table = None
+
+def iter_ods_rows(content, sheet=None):
+    """Lignes d'une feuille (la première par défaut) d'un content.xml ODS (générateur).
+
+    Les cellules et lignes vides répétées en fin de feuille sont ignorées.
+    """
+    found = False
+    empty_rows = 0
+    for table, elem in _iter_ods_elements(content):
+        if sheet is None:
+            sheet = table
+        if table != sheet:
+            if found:
+                return
+            continue
+        found = True
+        if elem is None:
+            continue
+        row = []
+        empty_cells = 0
+        for cell in elem:
+            if cell.tag not in ODS_CELLS:
+                continue
+            repeat = int(_ods_attr(cell, 'table', 'number-columns-repeated') or 1)
+            value = _ods_cell_value(cell)
+            if value is None:
+                empty_cells += repeat
+                continue
+            row.extend([None] * empty_cells)
+            row.extend([value] * repeat)
+            empty_cells = 0
+        repeat = int(_ods_attr(elem, 'table', 'number-rows-repeated') or 1)
+        if not row:
+            empty_rows += repeat
+            continue
+        for _ in range(empty_rows):
+            yield ()
+        empty_rows = 0
+        row = tuple(row)
+        for _ in range(repeat):
+            yield row
+
+class OdsBook:
+    """Classeur ODS ; chaque feuille est lue dans sa propre passe sur content.xml"""
+    def __init__(self, source):
+        self.archive = zipfile.ZipFile(spool_file(source))
+        self._contents = []
+
+    def _open_content(self):
+        content = self.archive.open('content.xml')
+        self._contents.append(content)
+        return content
+
+    def sheet_names(self):
+        return [table for table, row in _iter_ods_elements(self._open_content()) if row is None]
+
+    def active_sheet(self):
+        # La première feuille, sans lire le reste du document
+        return next(table for table, row in _iter_ods_elements(self._open_content()))
+
+    def rows(self, name):
+        return iter_ods_rows(self._open_content(), name), None
+
+    def close(self):
+        for content in self._contents:
+            content.close()
+        self.archive.close()
+
+# Lecteurs de classeurs par extension de fichier
+WORKBOOK_READERS = {
+    'xlsx': XlsxBook,
+    'csv': CsvBook,
+    'ods': OdsBook
+}
+
+def file_format(filename):
+    """Format d'un fichier envoyé, d'après son extension"""
+    return filename.rsplit('.', 1)[1].lower()
+
+# Validation des totaux : 'off' (aucune vérification), 'continue' (chaque
+# ligne vérifiée au fil de la lecture, toutes rendues, rapport des lignes
+# incohérentes) ou 'refuse' (toutes les lignes vérifiées avant le rendu, aucune
+# facture générée si une ligne est invalide)
+VALIDATION_MODES = {'off', 'continue', 'refuse'}
+LINE_ITEM_COLUMNS = ['Prix location total HT'] + [key for label, key in PRESTATIONS]
+HT_MISMATCH = "Total Location HT différent de la somme des prestations"
+TVA_MISMATCH = "TVA 20 % différente de 20 % du Total Location HT"
+TTC_MISMATCH = "TOTAL TTC différent de Total Location HT + TVA"
+
+def check_invoice_totals(invoice, tolerance=1):
+    """Erreurs de totaux d'une facture typée : somme des prestations et Total Location HT,
+    TVA à 20 %, TOTAL TTC égal à HT + TVA (à `tolerance` centimes près)"""
+    total_ht = invoice['Total Location HT']
+    tva = invoice['TVA 20 %']
+    errors = []
+    for message, expected, actual in (
+        (HT_MISMATCH, sum(invoice[col] for col in LINE_ITEM_COLUMNS), total_ht),
+        (TVA_MISMATCH, (total_ht * 20 + 50) // 100, tva),
+        (TTC_MISMATCH, total_ht + tva, invoice['TOTAL TTC'])
+    ):
+        if abs(expected - actual) > tolerance:
+            errors.append(f"{message} : {format_centimes(expected)} attendu, {format_centimes(actual)} trouvé")
+    return errors
+
+def check_invoice_rows(invoice_rows, on_invalid, tolerance=1):
+    """Vérifier les totaux de chaque ligne au fil de la lecture (générateur de (row_idx, facture)).
+
+    Toutes les lignes sont transmises ; `on_invalid({'row', 'invoice', 'errors'})`
+    est appelé pour chaque ligne incohérente, avant qu'elle ne soit rendue.
+    """
+    seconds = 0.0
+    for row_idx, row_data in invoice_rows:
+        started = time.perf_counter()
+        errors = check_invoice_totals(row_data, tolerance)
+        seconds += time.perf_counter() - started
+        if errors:
+            on_invalid({'row': row_idx, 'invoice': row_data['Facture Numero'], 'errors': errors})
+        yield row_idx, row_data
+    get_metrics().observe('validation', seconds)
+
+def validate_invoice_rows(invoice_rows, tolerance=1):
+    """Vérifier les totaux de toutes les lignes avant tout rendu (mêmes contrôles que check_invoice_rows).
+
+    Retourne les lignes en erreur, dans l'ordre du classeur :
+    [{'row': ..., 'invoice': ..., 'errors': [...]}].
+    """
+    report = []
+    for row_idx, row_data in invoice_rows:
+        errors = check_invoice_totals(row_data, tolerance)
+        if errors:
+            report.append({'row': row_idx, 'invoice': row_data['Facture Numero'], 'errors': errors})
+    return report
+
+OUTPUT_MODES = {'files', 'merged'}
+
+def process_sheet(book, name, progress=None, output_mode='files', validation='off', profile='compact',
+                  dry_run=False, on_row=None):
+    """Générer les factures d'une feuille et retourner son résultat.
+
+    Avec `validation` à 'continue', les totaux de chaque ligne sont vérifiés
+    au fil de la lecture ; avec 'refuse' (ou `dry_run`), toutes les lignes
+    sont lues et vérifiées avant le rendu. Le rapport est retourné sous la clé
+    'validation'. Les PDF sont rendus selon le profil `profile`, dont la taille
+    et la durée mesurées sont retournées sous la clé 'render'. Avec `dry_run`,
+    rien n'est rendu : le résultat compte les lignes valides (rows_done) et
+    invalides (rows_failed) et contient le rapport de chaque ligne invalide.
+    `progress(rows_done, rows_failed, total, pdf_files)` est appelé après
+    chaque ligne rendue, et `on_row(événement)` avec le détail de chaque ligne
+    rendue ou en erreur (numéro de facture, fichier, statut, durée du rendu,
+    erreurs de totaux).
+    """
+    metrics = get_metrics()
+    rows, total = book.rows(name)
+    
+    # Vérifier les en-têtes
+    with metrics.time('header_match'):
+        schema = compile_schema(next(rows, ()))
+    
+    # Vérifier si toutes les colonnes requises sont présentes
+    if schema.missing:
+        return {
+            'success': False, 
+            'error': f'Colonnes manquantes dans le fichier Excel: {", ".join(schema.missing)}'
+        }
+    
+    # Créer les PDF au fur et à mesure de la lecture des lignes ; les
+    # lignes dont une valeur est invalide sont comptées en erreur
+    invalid_rows = []
+    invoice_rows = iter_invoice_rows(
+        rows,
+        schema,
+        on_error=lambda row_idx, e: invalid_rows.append(
+            {'row': row_idx, 'invoice': e.invoice, 'errors': e.errors}
+        )
+    )
+    report = None
+    # Erreurs de totaux des lignes pas encore rendues (mode 'continue')
+    totals_errors = {}
+    if validation == 'refuse' or dry_run:
+        invoice_rows = list(invoice_rows)
+        report = []
+        if validation != 'off':
+            with metrics.time('validation'):
+                report = validate_invoice_rows(invoice_rows, app.config['VALIDATION_TOLERANCE'])
+        report = sorted(invalid_rows + report, key=lambda entry: entry['row'])
+        if dry_run:
+            checked = len(invoice_rows) + len(invalid_rows)
+            return {
+                'success': True,
+                'dry_run': True,
+                'files': [],
+                'rows_done': checked - len(report),
+                'rows_failed': len(report),
+                'message': f'{checked} lignes vérifiées, {len(report)} invalides',
+                'validation': report
+            }
+        if report and validation == 'refuse':
+            return {
+                'success': False,
+                'error': f'{len(report)} lignes invalides, aucune facture générée',
+                'validation': report
+            }
+    elif validation == 'continue':
+        # Sans lire tout le classeur d'abord : le rendu commence dès la première ligne
+        report = []
+        def invalid(entry):
+            report.append(entry)
+            totals_errors[entry['row']] = entry['errors']
+        invoice_rows = check_invoice_rows(invoice_rows, invalid, app.config['VALIDATION_TOLERANCE'])
+    # Factures rendues, à enregistrer dans l'index des factures
+    index_entries = []
+    pdf_bytes = 0
+    render_start = time.perf_counter()
+    # Les lignes en cours de rendu, pour décrire chaque résultat (numéro de
+    # facture, page du PDF unique) une fois la ligne rendue
+    drawing = {}
+    def remember(invoice_rows):
+        for row_idx, row_data in invoice_rows:
+            drawing[row_idx] = row_data
+            yield row_idx, row_data
+    invoice_rows = remember(invoice_rows)
+    if output_mode == 'merged':
+        merged_filename = f"factures_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.pdf"
+        merged_buffer = io.BytesIO()
+        results = create_invoices_pdf(invoice_rows, merged_buffer, profile)
+    else:
+        def stored(task, data):
+            nonlocal pdf_bytes
+            pdf_bytes += len(data)
+            index_entries.append(invoice_index_entry(task[1], task[2], hashlib.sha256(data).hexdigest()))
+        results = render_invoices(iter_render_tasks(invoice_rows, profile), on_stored=stored)
+    
+    pdf_files = []
+    done = 0
+    failed = 0
+    for row_idx, pdf_filename, error, seconds in results:
+        if error:
+            print(f"Erreur lors de la génération de la facture à la ligne {row_idx}: {error}")
+            failed += 1
+            metrics.inc('rows_failed')
+        else:
+            done += 1
+            metrics.inc('rows_rendered')
+            # Les factures servies par le cache ont une durée nulle
+            if seconds:
+                metrics.observe('render', seconds)
+            if pdf_filename:
+                pdf_files.append(pdf_filename)
+        row_data = drawing.pop(row_idx)
+        if output_mode == 'merged' and not error:
+            # Page du PDF unique : fichier et empreinte connus à la fin du document
+            index_entries.append(invoice_index_entry(row_data, merged_filename, None, page=done))
+        if on_row:
+            on_row({
+                'type': 'row',
+                'sheet': name,
+                'row': row_idx,
+                'invoice': row_data['Facture Numero'],
+                'file': pdf_filename,
+                # Les factures servies par le cache ont une durée nulle
+                'status': 'error' if error else 'rendered' if seconds else 'cached',
+                'seconds': round(seconds, 4),
+                'error': error,
+                'validation': totals_errors.pop(row_idx, None)
+            })
+        if progress:
+            progress(done, failed, total, pdf_files)
+        metrics.flush()
+    for entry in invalid_rows:
+        print(f"Erreur lors de la lecture de la facture à la ligne {entry['row']}: {' ; '.join(entry['errors'])}")
+        failed += 1
+        metrics.inc('rows_failed')
+        if on_row:
+            on_row({
+                'type': 'row',
+                'sheet': name,
+                'row': entry['row'],
+                'invoice': entry['invoice'],
+                'file': None,
+                'status': 'error',
+                'seconds': 0,
+                'error': ' ; '.join(entry['errors']),
+                'validation': None
+            })
+    if validation == 'continue':
+        report = sorted(invalid_rows + report, key=lambda entry: entry['row'])
+    if output_mode == 'merged' and done:
+        get_storage().put(merged_filename, merged_buffer.getvalue())
+        pdf_files.append(merged_filename)
+        pdf_bytes = merged_buffer.tell()
+        metrics.inc('pdf_bytes_written', pdf_bytes)
+        merged_hash = hashlib.sha256(merged_buffer.getvalue()).hexdigest()
+        for entry in index_entries:
+            entry['sha256'] = merged_hash
+    render = {'profile': profile, 'pdf_bytes': pdf_bytes, 'seconds': round(time.perf_counter() - render_start, 3)}
+    invoice_index = get_invoice_index()
+    if invoice_index:
+        invoice_index.add(index_entries)
+    
+    if not pdf_files:
+        return {
+            'success': False,
+            'error': 'Aucune facture n\'a pu être générée. Vérifiez le format de vos données.',
+            'validation': report
+        }
+    
+    return {
+        'success': True,
+        'files': pdf_files,
+        'rows_done': done,
+        'rows_failed': failed,
+        'message': f'{done} factures générées avec succès',
+        'validation': report,
+        'render': render
+    }
+
+def parse_sheets(value):
+    """Sélection de feuilles d'un upload : None (feuille active), ['*'] ou une liste de noms"""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    return names or None
+
+def process_sheets(book, names, progress=None, output_mode='files', validation='off', profile='compact',
+                   dry_run=False, on_row=None):
+    """Traiter plusieurs feuilles en parallèle et regrouper leurs résultats.
+
+    Chaque feuille est lue et envoyée au rendu par son propre thread (au plus
+    SHEET_WORKERS à la fois) ; les processus de rendu sont partagés. Le
+    résultat contient la somme des compteurs et, sous 'sheets', le résultat de
+    chaque feuille.
+    """
+    lock = threading.Lock()
+    states = {name: (0, 0, None, 0) for name in names}
+    all_files = []
+
+    def sheet_progress(name):
+        def update(done, failed, total, pdf_files):
+            with lock:
+                # Seuls les nouveaux fichiers de la feuille sont ajoutés à la liste commune
+                all_files.extend(pdf_files[states[name][3]:])
+                states[name] = (done, failed, total, len(pdf_files))
+                if progress:
+                    totals = [state[2] for state in states.values()]
+                    progress(
+                        sum(state[0] for state in states.values()),
+                        sum(state[1] for state in states.values()),
+                        None if None in totals else sum(totals),
+                        all_files
+                    )
+        return update
+
+    def run(name):
+        try:
+            return process_sheet(book, name, sheet_progress(name), output_mode, validation, profile, dry_run, on_row)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=min(len(names), app.config['SHEET_WORKERS'])) as executor:
+        results = dict(zip(names, executor.map(run, names)))
+    
+    files = [filename for result in results.values() for filename in result.get('files', [])]
+    done = sum(result.get('rows_done', 0) for result in results.values())
+    failed = sum(result.get('rows_failed', 0) for result in results.values())
+    renders = [result['render'] for result in results.values() if result.get('render')]
+    if dry_run:
+        return {
+            'success': all(result['success'] for result in results.values()),
+            'dry_run': True,
+            'files': [],
+            'rows_done': done,
+            'rows_failed': failed,
+            'message': f'{done + failed} lignes vérifiées, {failed} invalides ({len(names)} feuilles)',
+            'sheets': results
+        }
+    if not files:
+        return {
+            'success': False,
+            'error': 'Aucune facture n\'a pu être générée. Vérifiez le format de vos données.',
+            'sheets': results
+        }
+    return {
+        'success': True,
+        'files': files,
+        'rows_done': done,
+        'rows_failed': failed,
+        'message': f'{done} factures générées avec succès ({len(names)} feuilles)',
+        'sheets': results,
+        # Durée cumulée : les feuilles sont rendues en parallèle
+        'render': {
+            'profile': profile,
+            'pdf_bytes': sum(render['pdf_bytes'] for render in renders),
+            'seconds': round(sum(render['seconds'] for render in renders), 3)
+        }
+    }
+
+def process_workbook(source, progress=None, output_mode='files', file_format='xlsx', validation='off', sheets=None,
+                     profile='compact', dry_run=False, on_row=None):
+    """Générer les factures d'un classeur et retourner le résultat de l'upload.
+
+    `source` est le chemin du classeur ou un fichier ouvert (tampon de l'upload),
+    au format `file_format` (voir WORKBOOK_READERS). `sheets` choisit les
+    feuilles traitées : None pour la feuille active, ['*'] pour toutes, ou une
+    liste de noms ; plusieurs feuilles sont traitées en parallèle (voir
+    process_sheets). Avec `dry_run`, les lignes sont seulement lues, typées et
+    vérifiées, sans aucun rendu. Le fichier Excel est supprimé, ou le tampon
+    fermé, à la fin du traitement.
+    """
+    metrics = get_metrics()
+    try:
+        # Ouvrir le classeur (en lecture seule, ligne par ligne, en mode streaming)
+        with metrics.time('load_workbook'):
+            book = WORKBOOK_READERS[file_format](source)
+        with closing(book):
+            if not sheets:
+                return process_sheet(
+                    book, book.active_sheet(), progress, output_mode, validation, profile, dry_run, on_row
+                )
+            
+            available = book.sheet_names()
+            if sheets == ['*']:
+                names = available
+            else:
+                unknown = [name for name in sheets if name not in available]
+                if unknown:
+                    return {
+                        'success': False,
+                        'error': f'Feuilles introuvables dans le fichier: {", ".join(unknown)}'
+                    }
+                names = list(dict.fromkeys(sheets))
+            return process_sheets(book, names, progress, output_mode, validation, profile, dry_run, on_row)
+    finally:
+        # Nettoyer le fichier Excel
+        with metrics.time('cleanup'):
+            if not isinstance(source, str):
+                source.close()
+            elif os.path.exists(source):
+                os.remove(source)
+        metrics.inc('uploads')
+        metrics.flush(force=True)
+
+# Traitement des uploads en arrière-plan ; l'état des jobs est écrit dans
+# JOBS_FOLDER pour que n'importe quel worker gunicorn puisse le consulter
+_job_executor = None
+_job_executor_pid = None
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def get_job_executor():
+    """Retourner l'exécuteur des jobs du processus courant"""
+    global _job_executor, _job_executor_pid
+    if _job_executor is None or _job_executor_pid != os.getpid():
+        _job_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'])
+        _job_executor_pid = os.getpid()
+    return _job_executor
+
+def _job_path(job_id):
+    return os.path.join(app.config['JOBS_FOLDER'], f"{job_id}.json")
+
+def save_job(job):
+    """Écrire l'état d'un job de façon atomique"""
+    path = _job_path(job['id'])
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+# Nettoyage des jobs expirés au plus une fois par minute et par processus
+JOB_EXPIRY_INTERVAL = 60
+_jobs_expired_at = 0.0
+
+def expire_jobs():
+    """Supprimer l'état des jobs et des lots non modifiés depuis JOB_TTL"""
+    global _jobs_expired_at
+    ttl = app.config['JOB_TTL']
+    now = time.time()
+    if not ttl or now - _jobs_expired_at < JOB_EXPIRY_INTERVAL:
+        return
+    _jobs_expired_at = now
+    # Un job en cours est réécrit pendant son traitement : seuls les jobs
+    # terminés (et les fichiers temporaires abandonnés) vieillissent
+    for entry in os.scandir(app.config['JOBS_FOLDER']):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < now - ttl:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def load_job(job_id):
+    """Lire l'état d'un job, ou None s'il n'existe pas"""
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def run_upload_job(job, source, output_mode='files', file_format='xlsx', validation='off', sheets=None,
+                   profile='compact', dry_run=False):
+    """Traiter un upload en arrière-plan en publiant sa progression"""
+    job['status'] = 'running'
+    job['started'] = time.time()
+    save_job(job)
+    last_save = [0.0]
+
+    def progress(done, failed, total, pdf_files):
+        job['rows_done'] = done
+        job['rows_failed'] = failed
+        job['rows_total'] = total
+        now = time.time()
+        # Limiter les écritures sur disque à deux par seconde
+        if now - last_save[0] >= 0.5:
+            job['elapsed'] = round(now - job['started'], 3)
+            job['files'] = list(pdf_files)
+            save_job(job)
+            last_save[0] = now
+
+    try:
+        result = process_workbook(source, progress, output_mode, file_format, validation, sheets, profile, dry_run)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    job['status'] = 'done' if result['success'] else 'failed'
+    job['files'] = result.get('files', [])
+    job['rows_done'] = result.get('rows_done', job['rows_done'])
+    job['rows_failed'] = result.get('rows_failed', job['rows_failed'])
+    job['message'] = result.get('message')
+    job['error'] = result.get('error')
+    job['validation'] = result.get('validation')
+    job['sheets'] = result.get('sheets')
+    job['render'] = result.get('render')
+    job['elapsed'] = round(time.time() - job['started'], 3)
+    save_job(job)
+
+def new_job():
+    """Créer l'état initial d'un job (aussi utilisé comme lot de fichiers d'un upload)"""
+    return {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'created': time.time(),
+        'started': None,
+        'rows_done': 0,
+        'rows_failed': 0,
+        'rows_total': None,
+        'elapsed': 0,
+        'files': [],
+        'message': None,
+        'error': None,
+        'validation': None,
+        'sheets': None,
+        'render': None,
+        'dry_run': False
+    }
+
+def enqueue_upload_job(source, output_mode='files', file_format='xlsx', validation='off', sheets=None,
+                       profile='compact', dry_run=False):
+    """Créer un job pour un classeur (chemin ou tampon) et le mettre en file"""
+    expire_jobs()
+    job = new_job()
+    job['dry_run'] = dry_run
+    save_job(job)
+    get_job_executor().submit(
+        run_upload_job, job, source, output_mode, file_format, validation, sheets, profile, dry_run
+    )
+    return job
+
+def save_batch(result):
+    """Enregistrer le lot d'un upload terminé pour permettre son téléchargement en une seule archive"""
+    if result['success']:
+        expire_jobs()
+        job = new_job()
+        job.update(
+            status='done',
+            files=result['files'],
+            rows_done=result['rows_done'],
+            rows_failed=result['rows_failed']
+        )
+        save_job(job)
+        result['batch'] = job['id']
+
+def stream_upload(source, file_format, options):
+    """Traiter un upload en produisant ses événements en NDJSON (générateur).
+
+    Une ligne 'start', puis une ligne 'row' par facture rendue ou en erreur,
+    au fil du rendu, et enfin une ligne 'result' avec le résultat complet de
+    l'upload. Le traitement tourne dans son propre thread ; il va à son terme
+    même si le client se déconnecte.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = process_workbook(source, file_format=file_format, on_row=events.put, **options)
+            if not options['dry_run']:
+                save_batch(result)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        events.put({'type': 'result', **result})
+        events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    # Première ligne immédiate : le client sait que le traitement a commencé
+    yield json.dumps({'type': 'start', **options}) + "\n"
+    for event in iter(events.get, None):
+        yield json.dumps(event) + "\n"
+
+# Upload en plusieurs morceaux, pour les classeurs au-delà de MAX_CONTENT_LENGTH :
+# chaque morceau est un fichier de UPLOAD_FOLDER/<id>/, si bien que n'importe
+# quel worker gunicorn peut recevoir la suite d'un upload
+def _chunked_upload_dir(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], upload_id)
+
+def _chunk_path(upload_id, index):
+    return os.path.join(_chunked_upload_dir(upload_id), f"{index}.chunk")
+
+def load_chunked_upload(upload_id):
+    """Lire la description d'un upload en morceaux, ou None s'il n'existe pas"""
+    if not JOB_ID_PATTERN.match(upload_id):
+        return None
+    try:
+        with open(os.path.join(_chunked_upload_dir(upload_id), 'upload.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def next_chunk(upload):
+    """Numéro du premier morceau non reçu (upload['chunks'] si tous l'ont été)"""
+    received = set()
+    for name in os.listdir(_chunked_upload_dir(upload['id'])):
+        if name.endswith('.chunk'):
+            received.add(int(name[:-len('.chunk')]))
+    return next(index for index in itertools.count() if index not in received)
+
+def chunked_upload_gone(upload_id):
+    """Réponse pour un upload disparu pendant la requête : assemblé par un
+    finalize concurrent (409, comme un second finalize) ou expiré (404)"""
+    if os.path.isdir(f"{_chunked_upload_dir(upload_id)}.assembling"):
+        return jsonify({'success': False, 'error': 'Upload déjà terminé'}), 409
+    return jsonify({'success': False, 'error': 'Upload introuvable'}), 404
+
+def expire_chunked_uploads():
+    """Supprimer les uploads en morceaux sans nouvelle donnée depuis CHUNKED_UPLOAD_TTL"""
+    limit = time.time() - app.config['CHUNKED_UPLOAD_TTL']
+    for entry in os.scandir(app.config['UPLOAD_FOLDER']):
+        if entry.is_dir() and JOB_ID_PATTERN.match(entry.name) and entry.stat().st_mtime < limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def assemble_chunked_upload(upload):
+    """Réunir les morceaux d'un upload complet dans un seul fichier et retourner son chemin.
+
+    Le dossier des morceaux est d'abord renommé : un second appel pour le même
+    upload échoue (FileNotFoundError) au lieu d'assembler le fichier deux fois.
+    """
+    folder = _chunked_upload_dir(upload['id'])
+    assembling = f"{folder}.assembling"
+    os.rename(folder, assembling)
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f"{upload['id']}.{file_format(upload['filename'])}")
+    try:
+        with open(path, 'wb') as output:
+            for index in range(upload['chunks']):
+                with open(os.path.join(assembling, f"{index}.chunk"), 'rb') as chunk:
+                    shutil.copyfileobj(chunk, output)
+    finally:
+        shutil.rmtree(assembling, ignore_errors=True)
+    return path
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template(
+        'index.html',
+        chunk_size=app.config['CHUNK_SIZE'],
+        profiles=list(RENDER_PROFILES),
+        default_profile=app.config['RENDER_PROFILE']
+    )
+
+def detach_upload_stream(file):
+    """Retirer le tampon d'un fichier envoyé pour qu'il survive à la requête.
+
+    Werkzeug ferme les fichiers de la requête à la fin de celle-ci ; le tampon
+    détaché appartient à l'appelant, qui doit le fermer.
+    """
+    stream = file.stream
+    stream.seek(0)
+    file.stream = io.BytesIO()
+    return stream
+
+def parse_upload_options(form):
+    """Options de traitement d'un upload : (options, None) ou (None, message d'erreur)"""
+    output_mode = form.get('output', app.config['OUTPUT_MODE'])
+    if output_mode not in OUTPUT_MODES:
+        return None, f'Mode de sortie inconnu: {output_mode}'
+    
+    validation = form.get('validation', app.config['VALIDATION'])
+    if validation not in VALIDATION_MODES:
+        return None, f'Mode de validation inconnu: {validation}'
+    
+    profile = form.get('profile', app.config['RENDER_PROFILE'])
+    if profile not in RENDER_PROFILES:
+        return None, f'Profil de rendu inconnu: {profile}'
+    
+    return {
+        'output_mode': output_mode,
+        'validation': validation,
+        'sheets': parse_sheets(form.get('sheets', app.config['SHEETS'])),
+        'profile': profile,
+        'dry_run': form.get('dry_run') == '1'
+    }, None
 
 @app.route('/upload', methods=['POST'])
-def upload_file():
-    if 'file' not in request.files:
+def upload_file(dry_run=False):
+    # Réception du classeur dans un tampon en mémoire (voir InvoiceRequest)
+    with get_metrics().time('upload_save'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'success': False, 'error': 'Aucun fichier trouvé'})
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         return jsonify({'success': False, 'error': 'Aucun fichier sélectionné'})
     
     if not allowed_file(file.filename):
         return jsonify({'success': False, 'error': 'Type de fichier non autorisé'})
     
+    options, error = parse_upload_options(request.form)
+    if error:
+        return jsonify({'success': False, 'error': error})
+    options['dry_run'] = options['dry_run'] or dry_run
+    
     try:
-        # Sauvegarder le fichier Excel
-        filename = secure_filename(file.filename)
-        excel_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(excel_path)
+        # Mode asynchrone : retourner immédiatement l'identifiant du job
+        if request.form.get('async') == '1':
+            job = enqueue_upload_job(detach_upload_stream(file), file_format=file_format(file.filename), **options)
+            return jsonify({'success': True, 'job': job['id']}), 202
         
-        # Charger le workbook
-        wb = openpyxl.load_workbook(excel_path, data_only=True)
-        sheet = wb.active
+        # Mode flux, pour les clients d'API : une ligne NDJSON par facture dès
+        # qu'elle est rendue ; la réponse occupe le worker jusqu'à la fin du rendu
+        if request.form.get('stream') == '1':
+            return Response(
+                stream_upload(detach_upload_stream(file), file_format(file.filename), options),
+                mimetype='application/x-ndjson'
+            )
         
-        # Vérifier les en-têtes
-        headers = [str(cell.value).strip() if cell.value else '' for cell in sheet[1]]
-        
-        # Créer un dictionnaire de correspondance des colonnes
-        column_mapping = {}
-        for expected_col in EXPECTED_COLUMNS:
-            for i, header in enumerate(headers):
-                if header.lower() == expected_col.lower():
-                    column_mapping[expected_col] = i
-                    break
-        
-        # Vérifier si toutes les colonnes requises sont présentes
-        if len(column_mapping) != len(EXPECTED_COLUMNS):
-            missing_columns = set(EXPECTED_COLUMNS) - set(column_mapping.keys())
-            return jsonify({
-                'success': False, 
-                'error': f'Colonnes manquantes dans le fichier Excel: {", ".join(missing_columns)}'
-            })
-        
-        # Créer un PDF pour chaque ligne
-        pdf_files = []
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=2), 2):
-            # Extraire les données de la ligne en utilisant le mapping
-            row_data = {}
-            skip_row = False
-            
-            for col_name, col_idx in column_mapping.items():
-                value = row[col_idx].value
-                if value is None or value == '':
-                    skip_row = True
-                    break
-                row_data[col_name] = value
-            
-            if skip_row:
-                continue
-            
-            try:
-                # Générer un nom unique pour le PDF
-                invoice_num = str(row_data['Facture Numero']).strip()
-                pdf_filename = f"facture_{invoice_num}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-                pdf_path = os.path.join(app.config['OUTPUT_FOLDER'], pdf_filename)
-                
-                # Créer le PDF
-                create_invoice_pdf(row_data, pdf_path)
-                pdf_files.append(pdf_filename)
-                
-            except Exception as e:
-                print(f"Erreur lors de la génération de la facture à la ligne {row_idx}: {str(e)}")
-                continue
-        
-        # Nettoyer le fichier Excel
-        os.remove(excel_path)
-        
-        if not pdf_files:
-            return jsonify({
-                'success': False,
-                'error': 'Aucune facture n\'a pu être générée. Vérifiez le format de vos données.'
-            })
-        
-        return jsonify({
-            'success': True,
-            'files': pdf_files,
-            'message': f'{len(pdf_files)} factures générées avec succès'
-        })
+        # Lire le classeur directement depuis le tampon de la requête
+        result = process_workbook(file.stream, file_format=file_format(file.filename), **options)
+        if not options['dry_run']:
+            save_batch(result)
+        return jsonify(result)
         
     except Exception as e:
-        if os.path.exists(excel_path):
-            os.remove(excel_path)
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/validate', methods=['POST'])
+def validate_file():
+    """Vérifier un classeur sans générer de PDF (comme /upload avec dry_run=1)"""
+    return upload_file(dry_run=True)
+
+@app.route('/uploads', methods=['POST'])
+def init_chunked_upload():
+    """Commencer un upload en morceaux : {filename, size} -> identifiant et taille des morceaux"""
+    data = request.get_json(silent=True) or request.form
+    filename = data.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'success': False, 'error': 'Type de fichier non autorisé'})
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        size = 0
+    if not 0 < size <= app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return jsonify({'success': False, 'error': 'Taille de fichier invalide'})
+    
+    expire_chunked_uploads()
+    chunk_size = app.config['CHUNK_SIZE']
+    upload = {
+        'id': uuid.uuid4().hex,
+        'filename': filename,
+        'size': size,
+        'chunk_size': chunk_size,
+        'chunks': -(-size // chunk_size),
+        'created': time.time()
+    }
+    os.makedirs(_chunked_upload_dir(upload['id']))
+    with open(os.path.join(_chunked_upload_dir(upload['id']), 'upload.json'), 'w') as f:
+        json.dump(upload, f)
+    return jsonify({
+        'success': True,
+        'upload': upload['id'],
+        'chunk_size': chunk_size,
+        'chunks': upload['chunks'],
+        'next': 0
+    }), 201
+
+@app.route('/uploads/<upload_id>')
+def chunked_upload_status(upload_id):
+    """État d'un upload en morceaux : premier morceau à (ré)envoyer"""
+    upload = load_chunked_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload introuvable'}), 404
+    try:
+        missing = next_chunk(upload)
+    except FileNotFoundError:
+        return chunked_upload_gone(upload_id)
+    return jsonify({
+        'success': True,
+        'upload': upload_id,
+        'chunks': upload['chunks'],
+        'next': missing
+    })
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_chunk(upload_id, index):
+    """Recevoir le morceau `index` (corps brut de la requête)"""
+    upload = load_chunked_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload introuvable'}), 404
+    if index >= upload['chunks']:
+        return jsonify({'success': False, 'error': f'Morceau inconnu: {index}'}), 400
+    
+    expected = min(upload['chunk_size'], upload['size'] - index * upload['chunk_size'])
+    data = request.get_data(cache=False)
+    if len(data) != expected:
+        return jsonify({
+            'success': False,
+            'error': f'Taille du morceau {index} invalide: {len(data)} octets reçus, {expected} attendus'
+        }), 400
+    
+    # Écriture atomique : un morceau présent est toujours complet. Le dossier
+    # peut disparaître entre-temps (finalize concurrent, expiration)
+    path = _chunk_path(upload_id, index)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        missing = next_chunk(upload)
+    except FileNotFoundError:
+        return chunked_upload_gone(upload_id)
+    return jsonify({'success': True, 'received': index, 'next': missing})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Terminer un upload en morceaux et lancer son traitement en arrière-plan"""
+    upload = load_chunked_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload introuvable'}), 404
+    
+    options, error = parse_upload_options(request.form)
+    if error:
+        return jsonify({'success': False, 'error': error})
+    
+    try:
+        missing = next_chunk(upload)
+    except FileNotFoundError:
+        return chunked_upload_gone(upload_id)
+    if missing < upload['chunks']:
+        return jsonify({'success': False, 'error': f'Morceau manquant: {missing}', 'next': missing}), 409
+    
+    try:
+        path = assemble_chunked_upload(upload)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Upload déjà terminé'}), 409
+    # Le fichier assemblé est supprimé par process_workbook à la fin du traitement
+    job = enqueue_upload_job(path, file_format=file_format(upload['filename']), **options)
+    return jsonify({'success': True, 'job': job['id']}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job introuvable'}), 404
+    if job['status'] == 'running' and job['started']:
+        job['elapsed'] = round(time.time() - job['started'], 3)
+    return jsonify({'success': True, **job})
+
+# Nombre d'empreintes de fichiers locaux gardées en mémoire par processus
+DOWNLOAD_ETAG_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=DOWNLOAD_ETAG_CACHE_SIZE)
+def file_etag(path, mtime_ns, size):
+    """Empreinte SHA-256 d'un fichier local, calculée une fois par version du fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_for_download(response):
+    """En-têtes de cache d'un PDF stocké : son contenu ne change jamais"""
+    max_age = app.config['DOWNLOAD_MAX_AGE']
+    if max_age:
+        # Une facture contient des données client : pas de cache partagé
+        response.cache_control.no_cache = None
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    return response
+
+def accel_redirect(path, etag):
+    """Réponse vide dont le corps est envoyé par nginx (X-Accel-Redirect)"""
+    response = Response(mimetype='application/pdf')
+    # Nom du fichier stocké (déjà assaini), cité par werkzeug comme avec send_file
+    name = os.path.basename(path)
+    response.headers['X-Accel-Redirect'] = app.config['DOWNLOAD_ACCEL_PREFIX'] + name
+    response.headers.set('Content-Disposition', 'attachment', filename=name)
+    response.set_etag(etag)
+    # If-None-Match traité ici ; les plages (Range) sont servies par nginx
+    return response.make_conditional(request)
+
 @app.route('/download/<filename>')
 def download_file(filename):
+    """Télécharger un PDF stocké (ETag, 304, Range et cache navigateur)"""
     try:
-        return send_file(
-            os.path.join(app.config['OUTPUT_FOLDER'], filename),
-            as_attachment=True
-        )
+        storage = get_storage()
+        path = storage.local_path(filename)
+        if path:
+            stat = os.stat(path)
+            etag = file_etag(path, stat.st_mtime_ns, stat.st_size)
+            if app.config['DOWNLOAD_OFFLOAD'] == 'x-accel':
+                return cache_for_download(accel_redirect(path, etag))
+            return cache_for_download(send_file(path, as_attachment=True, etag=etag))
+        data = storage.get(filename)
+        if data is None:
+            return jsonify({'error': f'Fichier introuvable: {filename}'}), 404
+        return cache_for_download(send_file(
+            io.BytesIO(data),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=filename,
+            etag=hashlib.sha256(data).hexdigest()
+        ))
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
+# Taille maximale d'une page de résultats de /invoices
+INVOICE_SEARCH_MAX_PER_PAGE = 100
+
+def _invoice_json(entry):
+    """Facture de l'index, avec le lien de téléchargement de son PDF"""
+    return {**entry, 'download': url_for('download_file', filename=entry['file'])}
+
+@app.route('/invoices')
+def search_invoices():
+    """Rechercher des factures par client, immatriculation ou période (paginé)"""
+    invoice_index = get_invoice_index()
+    if invoice_index is None:
+        return jsonify({'success': False, 'error': 'Index des factures désactivé'}), 404
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        for value in (date_from, date_to):
+            if value:
+                date.fromisoformat(value)
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), INVOICE_SEARCH_MAX_PER_PAGE)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Paramètres de recherche invalides'}), 400
+    
+    total, invoices = invoice_index.search(
+        client=request.args.get('client', '').strip(),
+        plate=request.args.get('plate', '').strip(),
+        date_from=date_from,
+        date_to=date_to,
+        page=page,
+        per_page=per_page
+    )
+    return jsonify({
+        'success': True,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'invoices': [_invoice_json(entry) for entry in invoices]
+    })
+
+@app.route('/invoices/<path:number>')
+def invoice_lookup(number):
+    """Dernière facture générée pour un numéro"""
+    invoice_index = get_invoice_index()
+    entry = invoice_index.latest(number.strip()) if invoice_index else None
+    if entry is None:
+        return jsonify({'success': False, 'error': f'Facture introuvable: {number}'}), 404
+    return jsonify({'success': True, 'invoice': _invoice_json(entry)})
+
+@app.route('/invoices/<path:number>/pdf')
+def invoice_pdf(number):
+    """Télécharger le PDF de la dernière facture générée pour un numéro"""
+    invoice_index = get_invoice_index()
+    entry = invoice_index.latest(number.strip()) if invoice_index else None
+    if entry is None:
+        return jsonify({'error': f'Facture introuvable: {number}'}), 404
+    # Redirection temporaire : le fichier change si le numéro est rendu à
+    # nouveau, seul /download/<fichier> peut être mis en cache comme immuable
+    return redirect(url_for('download_file', filename=entry['file']))
+
+@app.route('/ready')
+def readiness():
+    """Prêt une fois le préchauffage terminé (lancé ici s'il n'a pas eu lieu avant le fork)"""
+    if _warm_up_done.is_set():
+        return jsonify({'status': 'ready'})
+    start_warm_up()
+    return jsonify({'status': 'warming'}), 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Exposer les métriques de tous les workers au format Prometheus"""
+    get_metrics().flush(force=True)
+    return Response(
+        render_metrics(app.config['METRICS_FOLDER']),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+class _ZipStream:
+    """Flux en écriture seule dont le contenu est vidé à chaque morceau envoyé"""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _open_stored(storage, name):
+    """Ouvrir un PDF du stockage en lecture, ou None s'il n'existe plus"""
+    path = storage.local_path(name)
+    if path:
+        return open(path, 'rb')
+    data = storage.get(name)
+    return io.BytesIO(data) if data is not None else None
+
+def iter_zip(names, storage, chunk_size=64 * 1024):
+    """Construire une archive ZIP des PDF morceau par morceau (générateur)"""
+    stream = _ZipStream()
+    # Le flux n'étant pas seekable, zipfile écrit des descripteurs de données
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as zf:
+        for name in names:
+            src = _open_stored(storage, name)
+            if src is None:
+                continue
+            zinfo = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+            with src, zf.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = stream.pop()
+                    if data:
+                        yield data
+            yield stream.pop()
+    yield stream.pop()
+
+@app.route('/download-zip')
+def download_zip():
+    """Télécharger en une seule archive les factures d'un ou plusieurs lots"""
+    names = {}
+    for batch_id in request.args.getlist('batch'):
+        job = load_job(batch_id)
+        if job is None:
+            return jsonify({'error': f'Lot introuvable: {batch_id}'}), 404
+        names.update(dict.fromkeys(job['files']))
+    if not names:
+        return jsonify({'error': 'Aucune facture à télécharger'}), 404
+    
+    return Response(
+        stream_with_context(iter_zip(list(names), get_storage())),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=factures.zip'}
+    )
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,6 @@
+"""Benchmarks du générateur de factures.
+
+- `python -m benchmarks.generate` crée des classeurs de test valides ;
+- `python -m benchmarks.run` mesure chaque étape du traitement et écrit un JSON ;
+- `python -m benchmarks.compare` compare deux fichiers de résultats.
+"""
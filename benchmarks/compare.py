@@ -0,0 +1,51 @@
+"""Comparaison de deux fichiers de résultats de benchmarks.run.
+
+Exemple :
+    python -m benchmarks.compare avant.json apres.json --threshold 0.10
+Le code de sortie vaut 1 si une étape a ralenti de plus du seuil.
+"""
+import argparse
+import json
+import sys
+
+def load_results(path):
+    with open(path) as f:
+        return {(r['app'], r['rows']): r['stages'] for r in json.load(f)['results']}
+
+def compare(before, after, threshold, min_seconds=0.001):
+    """Afficher l'évolution de chaque étape ; retourne la liste des régressions.
+
+    Les étapes plus courtes que `min_seconds` sont affichées mais jamais
+    signalées, leur mesure étant dominée par le bruit.
+    """
+    regressions = []
+    for key in sorted(set(before) & set(after)):
+        app, rows = key
+        print(f"{app} ({rows} lignes)")
+        for stage, old in before[key].items():
+            new = after[key].get(stage)
+            if new is None:
+                continue
+            ratio = new / old if old else 1.0
+            flag = ''
+            if ratio > 1 + threshold and max(old, new) >= min_seconds:
+                flag = '  <-- régression'
+                regressions.append((app, rows, stage, ratio))
+            print(f"  {stage:<28} {old:>10.4f}s -> {new:>10.4f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparer deux résultats de benchmark")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.10, help="ralentissement toléré (défaut 0.10 = 10 %%)")
+    parser.add_argument('--min-seconds', type=float, default=0.001, help="durée en dessous de laquelle une étape n'est pas signalée")
+    args = parser.parse_args()
+
+    regressions = compare(load_results(args.before), load_results(args.after), args.threshold, args.min_seconds)
+    if regressions:
+        print(f"{len(regressions)} régression(s) au-delà de {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
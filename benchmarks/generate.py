@@ -0,0 +1,79 @@
+"""Génération de classeurs Excel synthétiques contenant les 23 colonnes attendues"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+import openpyxl
+
+CLIENTS = [
+    "Société Générale Maroc", "Hôtel Atlas", "Agence Équinoxe", "Café de la Gare",
+    "Transports Benali", "Clinique Al Amal", "Riad Fès", "Bâtiment & Cie"
+]
+VEHICLES = ["Dacia Logan", "Renault Clio", "Peugeot 208", "Hyundai Accent", "Fiat Tipo", "Toyota Yaris"]
+
+# Colonnes de prestations, dans l'ordre de EXPECTED_COLUMNS
+EXTRA_COLUMNS = [
+    'Surclassement HT',
+    'Sup 2eme Conducteur HT',
+    'Out of Hours HT',
+    'CDW HT',
+    'TPC HT',
+    'PAI HT',
+    'SUPER CDW HT',
+    'GPS HT',
+    'Siege Bebe HT',
+    'One Way HT'
+]
+
+def generate_row(index, rng):
+    """Générer une ligne de facture cohérente (totaux et TVA justes)"""
+    invoice_date = datetime(2024, 1, 1) + timedelta(days=rng.randrange(365))
+    departure = invoice_date + timedelta(days=rng.randrange(5))
+    days = rng.randint(1, 30)
+    daily_price = round(rng.uniform(150, 900), 2)
+    rental = round(daily_price * days, 2)
+    extras = [rng.choice([0, 0, 0, 50, 100, 150.5]) for _ in EXTRA_COLUMNS]
+    total_ht = round(rental + sum(extras), 2)
+    tva = round(total_ht * 0.20, 2)
+    return {
+        'Facture Numero': 10000 + index,
+        'Date de facture': invoice_date,
+        'Client': rng.choice(CLIENTS),
+        'Date de Depart': departure,
+        'Date de Retour': departure + timedelta(days=days),
+        'Marque du Vehicule': rng.choice(VEHICLES),
+        'Matricule': f"{rng.randint(1, 99999)}-{rng.choice('ABDEH')}-{rng.randint(1, 89)}",
+        'Nombre de jours': days,
+        'Prix par jour HT': daily_price,
+        'Prix location total HT': rental,
+        **dict(zip(EXTRA_COLUMNS, extras)),
+        'Total Location HT': total_ht,
+        'TVA 20 %': tva,
+        'TOTAL TTC': round(total_ht + tva, 2)
+    }
+
+def generate_workbook(path, rows, columns, seed=0):
+    """Écrire un classeur de `rows` factures avec les en-têtes `columns`"""
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet('Factures')
+    sheet.append(list(columns))
+    for index in range(rows):
+        row = generate_row(index, rng)
+        sheet.append([row[column] for column in columns])
+    wb.save(path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Générer un classeur de factures de test")
+    parser.add_argument('output', help="chemin du fichier .xlsx à créer")
+    parser.add_argument('--rows', type=int, default=10, help="nombre de factures (défaut 10)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import EXPECTED_COLUMNS
+    generate_workbook(args.output, args.rows, EXPECTED_COLUMNS, args.seed)
+    print(f"{args.rows} factures écrites dans {args.output}")
+
+if __name__ == '__main__':
+    main()
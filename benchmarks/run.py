@@ -0,0 +1,191 @@
+"""Mesure du temps passé dans chaque étape du traitement d'un upload.
+
+Exemple :
+    python -m benchmarks.run --apps app.py v1/app.py v2/app.py --sizes 10 100 1000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+import openpyxl
+import reportlab
+
+from benchmarks.generate import generate_workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def load_app(app_path, name):
+    """Importer une version de l'application sous un nom de module unique"""
+    spec = importlib.util.spec_from_file_location(name, app_path)
+    module = importlib.util.module_from_spec(spec)
+    # Enregistré avant l'exécution : les processus de rendu retrouvent le module
+    # par son nom pour désérialiser les fonctions qui leur sont envoyées
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def time_app_reader(module, workbook_path, stages):
+    """Lire le classeur avec le lecteur de l'application (WORKBOOK_READERS) ;
+    retourne les factures typées"""
+    start = perf_counter()
+    book = module.WORKBOOK_READERS['xlsx'](workbook_path)
+    sheet_rows, total = book.rows(book.active_sheet())
+    stages['load_workbook'] = perf_counter() - start
+
+    start = perf_counter()
+    schema = module.compile_schema(next(sheet_rows, ()))
+    stages['header_mapping'] = perf_counter() - start
+
+    start = perf_counter()
+    rows = []
+    for row in sheet_rows:
+        row_data = schema.decode(row)
+        if row_data is not None:
+            rows.append(row_data)
+    stages['row_extraction'] = perf_counter() - start
+    book.close()
+    return rows
+
+def time_openpyxl_reader(module, workbook_path, stages):
+    """Lire le classeur avec openpyxl pour les versions sans lecteur propre ;
+    retourne les lignes extraites"""
+    start = perf_counter()
+    wb = openpyxl.load_workbook(workbook_path, data_only=True)
+    sheet = wb.active
+    stages['load_workbook'] = perf_counter() - start
+
+    start = perf_counter()
+    if hasattr(module, 'compile_schema'):
+        # Les versions avec schéma associent les en-têtes avec leur propre code
+        schema = module.compile_schema([cell.value for cell in sheet[1]])
+    else:
+        headers = [str(cell.value).strip() if cell.value else '' for cell in sheet[1]]
+        column_mapping = {}
+        for expected_col in module.EXPECTED_COLUMNS:
+            for i, header in enumerate(headers):
+                if header.lower() == expected_col.lower():
+                    column_mapping[expected_col] = i
+                    break
+    stages['header_mapping'] = perf_counter() - start
+
+    start = perf_counter()
+    rows = []
+    if hasattr(module, 'compile_schema'):
+        # Les versions avec schéma rendent des factures typées
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            row_data = schema.decode(row)
+            if row_data is not None:
+                rows.append(row_data)
+    else:
+        for row in sheet.iter_rows(min_row=2):
+            row_data = {col_name: row[col_idx].value for col_name, col_idx in column_mapping.items()}
+            if all(value is not None and value != '' for value in row_data.values()):
+                rows.append(row_data)
+    stages['row_extraction'] = perf_counter() - start
+    wb.close()
+    return rows
+
+def time_stages(module, workbook_path, render_limit=None):
+    """Mesurer chaque étape séparément ; retourne les durées en secondes"""
+    stages = {}
+
+    if hasattr(module, 'WORKBOOK_READERS'):
+        rows = time_app_reader(module, workbook_path, stages)
+    else:
+        rows = time_openpyxl_reader(module, workbook_path, stages)
+
+    rendered = rows[:render_limit] if render_limit else rows
+    with tempfile.TemporaryDirectory() as output_folder:
+        start = perf_counter()
+        for i, row_data in enumerate(rendered):
+            module.create_invoice_pdf(row_data, os.path.join(output_folder, f"{i}.pdf"))
+        stages['create_invoice_pdf'] = perf_counter() - start
+    stages['create_invoice_pdf_per_row'] = stages['create_invoice_pdf'] / len(rendered) if rendered else 0
+
+    client = module.app.test_client()
+    with open(workbook_path, 'rb') as f:
+        start = perf_counter()
+        response = client.post(
+            '/upload',
+            data={'file': (f, os.path.basename(workbook_path))},
+            content_type='multipart/form-data'
+        )
+        stages['upload'] = perf_counter() - start
+    result = response.get_json()
+    if not result or not result.get('success'):
+        raise RuntimeError(f"Échec de /upload : {result}")
+    return stages
+
+def run(apps, sizes, repeat=1, render_limit=None):
+    """Exécuter le benchmark de chaque application pour chaque taille de classeur"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for app_index, app_path in enumerate(apps):
+            app_path = os.path.abspath(app_path)
+            # Chaque version crée ses dossiers uploads/ et output/ dans le dossier courant
+            app_dir = os.path.join(tmp, f"app{app_index}")
+            os.makedirs(app_dir)
+            with working_directory(app_dir):
+                module = load_app(app_path, f"bench_app{app_index}")
+                # Mesurer le rendu, pas le cache des factures
+                if 'RENDER_CACHE_MAX_ENTRIES' in module.app.config:
+                    module.app.config['RENDER_CACHE_MAX_ENTRIES'] = 0
+                for rows in sizes:
+                    workbook_path = os.path.join(tmp, f"factures_{rows}.xlsx")
+                    if not os.path.exists(workbook_path):
+                        generate_workbook(workbook_path, rows, module.EXPECTED_COLUMNS)
+                    runs = [time_stages(module, workbook_path, render_limit) for _ in range(repeat)]
+                    # Garder la meilleure mesure de chaque étape
+                    stages = {name: min(r[name] for r in runs) for name in runs[0]}
+                    results.append({
+                        'app': os.path.relpath(app_path, ROOT),
+                        'rows': rows,
+                        'stages': stages
+                    })
+                    print(f"{results[-1]['app']:<12} {rows:>7} lignes  " +
+                          "  ".join(f"{name}={value:.4f}s" for name, value in stages.items()))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesurer les étapes du traitement d'un upload")
+    parser.add_argument('--apps', nargs='+', default=['app.py'], help="versions à comparer (défaut app.py)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000], help="nombres de lignes (10 à 100000)")
+    parser.add_argument('--repeat', type=int, default=1, help="nombre de répétitions, la meilleure est gardée")
+    parser.add_argument('--render-limit', type=int, help="nombre maximal de lignes rendues dans l'étape create_invoice_pdf")
+    parser.add_argument('--output', default='benchmark_results.json', help="fichier JSON de résultats")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    results = run(args.apps, args.sizes, args.repeat, args.render_limit)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'openpyxl': openpyxl.__version__,
+                'reportlab': reportlab.Version
+            },
+            'results': results
+        }, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+if __name__ == '__main__':
+    main()
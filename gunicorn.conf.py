@@ -0,0 +1,16 @@
+"""Configuration gunicorn de production : gunicorn -c gunicorn.conf.py app:app
+
+L'application est chargée une seule fois dans le processus maître puis
+préchauffée (modules, polices, une facture jetable) avant la création des
+workers, qui démarrent donc déjà prêts. Le port (PORT) et le nombre de workers
+(WEB_CONCURRENCY) restent lus par gunicorn dans l'environnement.
+"""
+
+preload_app = True
+
+
+def when_ready(server):
+    """Préchauffer l'application avant le fork des workers"""
+    from app import warm_up
+    server.log.info("Préchauffage de l'application")
+    warm_up()
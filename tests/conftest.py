@@ -0,0 +1,50 @@
+"""Configuration commune des tests"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py crée ses dossiers (uploads/, output/, cache/...) et ses bases SQLite
+# dans le dossier courant dès l'import : les tests tournent dans un dossier jetable
+os.chdir(tempfile.mkdtemp(prefix='factures-tests-'))
+
+
+@pytest.fixture
+def make_row():
+    """Fabrique de lignes brutes de classeur : (en-têtes, valeurs) d'une facture cohérente"""
+    from app import EXPECTED_COLUMNS
+
+    def make(overrides=None):
+        values = {
+            'Facture Numero': 'F001',
+            'Date de facture': '2024-03-01',
+            'Client': 'Société Exemple',
+            'Date de Depart': '2024-02-20',
+            'Date de Retour': '2024-02-25',
+            'Marque du Vehicule': 'Dacia Logan',
+            'Matricule': '12345-A-6',
+            'Nombre de jours': 5,
+            'Prix par jour HT': 200,
+            'Prix location total HT': 1000,
+            'Surclassement HT': 0,
+            'Sup 2eme Conducteur HT': 0,
+            'Out of Hours HT': 0,
+            'CDW HT': 100,
+            'TPC HT': 0,
+            'PAI HT': 0,
+            'SUPER CDW HT': 0,
+            'GPS HT': 50.5,
+            'Siege Bebe HT': 0,
+            'One Way HT': 0,
+            'Total Location HT': 1150.5,
+            'TVA 20 %': 230.1,
+            'TOTAL TTC': 1380.6
+        }
+        values.update(overrides or {})
+        return list(EXPECTED_COLUMNS), [values[col] for col in EXPECTED_COLUMNS]
+
+    return make
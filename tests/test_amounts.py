@@ -0,0 +1,125 @@
+"""Tests des montants en lettres"""
+import pytest
+
+from app import amounts_to_letters, centimes_to_letters, number_to_letters, to_centimes
+
+
+# Implémentation remplacée, conservée telle quelle comme référence : elle
+# reste juste pour les entiers sous le milliard, seules ses décimales
+# (lues dans str(float)) étaient fausses
+def old_number_to_letters(number):
+    """Convertir un nombre en lettres"""
+    units = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
+    tens = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante-dix", "quatre-vingt", "quatre-vingt-dix"]
+    teens = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf"]
+
+    def convert_less_than_thousand(n):
+        if n == 0:
+            return ""
+
+        result = []
+        # Centaines
+        if n >= 100:
+            if n // 100 == 1:
+                result.append("cent")
+            else:
+                result.extend([units[n // 100], "cent"])
+            n = n % 100
+
+        # Dizaines et unités
+        if n >= 10:
+            if n < 20:
+                result.append(teens[n - 10])
+                return " ".join(result)
+            else:
+                ten_digit = n // 10
+                unit_digit = n % 10
+                if ten_digit == 7 or ten_digit == 9:
+                    result.append(tens[ten_digit - 1])
+                    if unit_digit == 1:
+                        result.append("et")
+                    result.append(teens[unit_digit])
+                else:
+                    result.append(tens[ten_digit])
+                    if unit_digit == 1 and ten_digit != 8:
+                        result.append("et")
+                    if unit_digit > 0:
+                        result.append(units[unit_digit])
+        elif n > 0:
+            result.append(units[n])
+
+        return " ".join(result)
+
+    if number == 0:
+        return "zéro"
+
+    # Séparer les parties entière et décimale
+    parts = str(number).replace(',', '.').split('.')
+    integer_part = int(parts[0])
+    decimal_part = int(parts[1]) if len(parts) > 1 else 0
+
+    result = []
+
+    # Traiter la partie entière
+    if integer_part == 0:
+        result.append("zéro")
+    else:
+        # Millions
+        if integer_part >= 1000000:
+            millions = integer_part // 1000000
+            if millions == 1:
+                result.append("un million")
+            else:
+                result.extend([convert_less_than_thousand(millions), "millions"])
+            integer_part = integer_part % 1000000
+
+        # Milliers
+        if integer_part >= 1000:
+            thousands = integer_part // 1000
+            if thousands == 1:
+                result.append("mille")
+            else:
+                result.extend([convert_less_than_thousand(thousands), "mille"])
+            integer_part = integer_part % 1000
+
+        # Reste
+        if integer_part > 0:
+            result.append(convert_less_than_thousand(integer_part))
+
+    # Ajouter "dirhams"
+    result.append("dirhams")
+
+    # Traiter la partie décimale
+    if decimal_part > 0:
+        result.append("et")
+        result.append(convert_less_than_thousand(decimal_part))
+        result.append("centimes")
+
+    return " ".join(result).capitalize()
+
+
+def test_integers_match_previous_implementation():
+    for n in range(200000):
+        assert number_to_letters(n) == old_number_to_letters(n), n
+
+
+@pytest.mark.parametrize('amount, expected', [
+    (12.5, "Douze dirhams et cinquante centimes"),
+    ('12,50', "Douze dirhams et cinquante centimes"),
+    (0.01, "Zéro dirhams et un centimes"),
+    (1.005, "Un dirhams et un centimes"),
+    (2000000000, "Deux milliards dirhams"),
+])
+def test_amounts(amount, expected):
+    assert number_to_letters(amount) == expected
+
+
+def test_to_centimes_rounds_half_up():
+    assert to_centimes('1 234,565') == 123457
+    assert to_centimes(19.99) == 1999
+    assert to_centimes(7) == 700
+
+
+def test_amounts_to_letters_converts_a_column():
+    amounts = [1, 2.5, '3,75']
+    assert amounts_to_letters(amounts) == [centimes_to_letters(to_centimes(a)) for a in amounts]
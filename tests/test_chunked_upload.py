@@ -0,0 +1,116 @@
+"""Tests de l'upload en morceaux"""
+import os
+import shutil
+
+import pytest
+
+import app as app_module
+
+DATA = b'Facture Numero;Client\n1;A\n'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'CHUNK_SIZE', 10)
+    return app_module.app.test_client()
+
+
+def start(client, size=len(DATA)):
+    response = client.post('/uploads', json={'filename': 'factures.csv', 'size': size})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def put(client, upload_id, index):
+    return client.put(f'/uploads/{upload_id}/chunks/{index}', data=DATA[index * 10:(index + 1) * 10])
+
+
+def upload_dir(upload_id):
+    return os.path.join(app_module.app.config['UPLOAD_FOLDER'], upload_id)
+
+
+def test_missing_chunk_and_resume(client):
+    upload = start(client)
+    assert upload['chunks'] == 3
+    assert put(client, upload['upload'], 0).get_json()['next'] == 1
+    assert put(client, upload['upload'], 2).get_json()['next'] == 1
+
+    response = client.post(f"/uploads/{upload['upload']}/finalize")
+    assert response.status_code == 409
+    assert response.get_json()['next'] == 1
+
+    # Reprise : le client demande où en est l'upload et renvoie la suite
+    status = client.get(f"/uploads/{upload['upload']}").get_json()
+    assert status['next'] == 1
+    assert put(client, upload['upload'], 1).get_json()['next'] == 3
+
+    response = client.post(f"/uploads/{upload['upload']}/finalize")
+    assert response.status_code == 202
+    assert response.get_json()['job']
+
+
+def test_chunk_sent_twice_is_kept_once(client):
+    upload = start(client)
+    put(client, upload['upload'], 0)
+    response = put(client, upload['upload'], 0)
+    assert response.get_json() == {'success': True, 'received': 0, 'next': 1}
+
+
+def test_invalid_chunks(client):
+    upload = start(client)
+    assert put(client, upload['upload'], 3).status_code == 400
+    response = client.put(f"/uploads/{upload['upload']}/chunks/0", data=b'court')
+    assert response.status_code == 400
+    assert client.put('/uploads/inconnu/chunks/0', data=DATA[:10]).status_code == 404
+
+
+def test_double_finalize(client):
+    upload = start(client)
+    for index in range(upload['chunks']):
+        put(client, upload['upload'], index)
+    assert client.post(f"/uploads/{upload['upload']}/finalize").status_code == 202
+    response = client.post(f"/uploads/{upload['upload']}/finalize")
+    assert response.status_code == 404
+    assert put(client, upload['upload'], 0).status_code == 404
+
+
+@pytest.fixture
+def concurrent(monkeypatch):
+    """Fait disparaître le dossier de l'upload juste après sa lecture par la route"""
+    load = app_module.load_chunked_upload
+
+    def use(remove):
+        def load_then_remove(upload_id):
+            upload = load(upload_id)
+            remove(upload_dir(upload_id))
+            return upload
+        monkeypatch.setattr(app_module, 'load_chunked_upload', load_then_remove)
+
+    return use
+
+
+def test_finalize_racing_with_finalize(client, concurrent):
+    upload = start(client)
+    for index in range(upload['chunks']):
+        put(client, upload['upload'], index)
+    concurrent(lambda folder: os.rename(folder, f'{folder}.assembling'))
+    response = client.post(f"/uploads/{upload['upload']}/finalize")
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Upload déjà terminé'
+
+
+def test_chunk_racing_with_finalize(client, concurrent):
+    upload = start(client)
+    put(client, upload['upload'], 0)
+    concurrent(lambda folder: os.rename(folder, f'{folder}.assembling'))
+    response = put(client, upload['upload'], 1)
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Upload déjà terminé'
+
+
+def test_chunk_racing_with_expiration(client, concurrent):
+    upload = start(client)
+    concurrent(shutil.rmtree)
+    response = put(client, upload['upload'], 0)
+    assert response.status_code == 404
+    assert response.get_json()['error'] == 'Upload introuvable'
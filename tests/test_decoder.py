@@ -0,0 +1,94 @@
+"""Tests du décodage typé des lignes"""
+from datetime import date, datetime
+
+import pytest
+
+from app import InvalidRowError, InvoiceSchema, iter_invoice_rows
+
+
+def test_decode_types(make_row):
+    headers, row = make_row({'Date de facture': datetime(2024, 3, 1, 10, 30), 'Nombre de jours': '5'})
+    invoice = InvoiceSchema(headers).decode(row)
+    assert invoice['Facture Numero'] == 'F001'
+    assert invoice['Date de facture'] == date(2024, 3, 1)
+    assert invoice['Date de Depart'] == date(2024, 2, 20)
+    assert invoice['Nombre de jours'] == 5
+    assert invoice['GPS HT'] == 5050
+    assert invoice['TOTAL TTC'] == 138060
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('01/03/2024', date(2024, 3, 1)),
+    ('01-03-2024', date(2024, 3, 1)),
+    ('2024-03-01 00:00:00', date(2024, 3, 1)),
+])
+def test_decode_text_dates(make_row, value, expected):
+    headers, row = make_row({'Date de facture': value})
+    assert InvoiceSchema(headers).decode(row)['Date de facture'] == expected
+
+
+def test_headers_are_matched_by_alias_and_case(make_row):
+    headers, row = make_row()
+    headers = [header.upper() for header in headers]
+    headers[headers.index('TOTAL TTC')] = 'Montant TTC'
+    schema = InvoiceSchema(headers, {'TOTAL TTC': ['montant ttc']})
+    assert schema.missing == []
+    assert schema.decode(row)['TOTAL TTC'] == 138060
+
+
+def test_missing_columns(make_row):
+    headers, row = make_row()
+    headers[headers.index('Client')] = 'Nom'
+    assert InvoiceSchema(headers).missing == ['Client']
+
+
+@pytest.mark.parametrize('value', [None, ''])
+def test_incomplete_row_is_skipped(make_row, value):
+    headers, row = make_row({'Matricule': value})
+    assert InvoiceSchema(headers).decode(row) is None
+
+
+def test_short_row_is_incomplete(make_row):
+    headers, row = make_row()
+    assert InvoiceSchema(headers + ['Remarque']).decode(row[:5]) is None
+
+
+def test_invalid_values_are_all_reported(make_row):
+    headers, row = make_row({'Date de Retour': '31/02/2024', 'Nombre de jours': '2,5', 'CDW HT': 'cent'})
+    with pytest.raises(InvalidRowError) as raised:
+        InvoiceSchema(headers).decode(row)
+    assert raised.value.invoice == 'F001'
+    assert raised.value.errors == [
+        "Date de Retour : date invalide (31/02/2024)",
+        "Nombre de jours : nombre entier invalide (2,5)",
+        "CDW HT : montant invalide (cent)",
+    ]
+    assert str(raised.value) == " ; ".join(raised.value.errors)
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', 'abc'])
+def test_invalid_integer(make_row, value):
+    headers, row = make_row({'Nombre de jours': value})
+    with pytest.raises(InvalidRowError):
+        InvoiceSchema(headers).decode(row)
+
+
+def test_iter_invoice_rows_reports_invalid_rows(make_row):
+    headers, good = make_row()
+    bad = make_row({'Facture Numero': 'F002', 'TOTAL TTC': 'n/a'})[1]
+    empty = make_row({'Client': None})[1]
+    errors = []
+    rows = list(iter_invoice_rows(
+        [good, bad, empty, good],
+        InvoiceSchema(headers),
+        on_error=lambda row_idx, e: errors.append((row_idx, e.invoice, e.errors))
+    ))
+    assert [row_idx for row_idx, invoice in rows] == [2, 5]
+    assert errors == [(3, 'F002', ["TOTAL TTC : montant invalide (n/a)"])]
+
+
+def test_iter_invoice_rows_without_error_callback(make_row):
+    headers, good = make_row()
+    bad = make_row({'TOTAL TTC': 'n/a'})[1]
+    rows = list(iter_invoice_rows([bad, good], InvoiceSchema(headers), start=10))
+    assert [row_idx for row_idx, invoice in rows] == [11]
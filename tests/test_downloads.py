@@ -0,0 +1,61 @@
+"""Tests des téléchargements de PDF"""
+import pytest
+
+import app as app_module
+from app import InvoiceSchema, get_invoice_index, get_storage, invoice_index_entry
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_download_is_cacheable(client):
+    get_storage().put('facture_F1_0123.pdf', b'%PDF-1.4 v1')
+    response = client.get('/download/facture_F1_0123.pdf')
+    assert response.status_code == 200
+    assert response.data == b'%PDF-1.4 v1'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get('/download/facture_F1_0123.pdf', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_invoice_pdf_redirects_to_latest_file(client, make_row):
+    headers, row = make_row({'Facture Numero': 'F77'})
+    invoice = InvoiceSchema(headers).decode(row)
+    get_storage().put('facture_F77_aaaa.pdf', b'%PDF-1.4 ancienne')
+    old = invoice_index_entry(invoice, 'facture_F77_aaaa.pdf', 'a' * 64)
+    get_invoice_index().add([old])
+
+    response = client.get('/invoices/F77/pdf')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/download/facture_F77_aaaa.pdf')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+
+    # Le numéro rendu à nouveau : la même adresse mène au nouveau fichier
+    get_storage().put('facture_F77_bbbb.pdf', b'%PDF-1.4 nouvelle')
+    new = invoice_index_entry(invoice, 'facture_F77_bbbb.pdf', 'b' * 64)
+    new['created'] = old['created'] + 1
+    get_invoice_index().add([new])
+    response = client.get('/invoices/F77/pdf', follow_redirects=True)
+    assert response.status_code == 200
+    assert response.data == b'%PDF-1.4 nouvelle'
+
+
+def test_invoice_pdf_unknown_number(client):
+    assert client.get('/invoices/inconnue/pdf').status_code == 404
+
+
+def test_accel_redirect_names_the_stored_file(client, monkeypatch):
+    get_storage().put('facture "F9";.pdf', b'%PDF-1.4 F9')
+    url = '/download/facture%20%22F9%22%3B.pdf'
+    sent = client.get(url)
+    assert sent.status_code == 200
+
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_OFFLOAD', 'x-accel')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/protected-output/facture_F9.pdf'
+    # Même en-tête que send_file : le nom assaini du fichier stocké, jamais celui de l'URL
+    assert response.headers['Content-Disposition'] == sent.headers['Content-Disposition']
+    assert response.headers['Content-Disposition'] == 'attachment; filename=facture_F9.pdf'
@@ -0,0 +1,95 @@
+"""Tests de l'index des factures : recherche et rétention"""
+import pytest
+
+import app as app_module
+from app import (InvoiceIndex, InvoiceSchema, LocalStorage, RetentionIndex, TrackedStorage,
+                 invoice_index_entry, sweep_storage)
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def invoice_index(tmp_path, monkeypatch):
+    index = InvoiceIndex(str(tmp_path / 'invoices.db'))
+    monkeypatch.setattr(app_module, '_invoice_index', index)
+    return index
+
+
+@pytest.fixture
+def add_invoice(invoice_index, make_row):
+    def add(number, filename, created=0, **overrides):
+        headers, row = make_row({'Facture Numero': number, **overrides})
+        entry = invoice_index_entry(InvoiceSchema(headers).decode(row), filename, 'a' * 64)
+        entry['created'] = created
+        invoice_index.add([entry])
+    return add
+
+
+def numbers(response):
+    assert response.status_code == 200
+    return [invoice['number'] for invoice in response.get_json()['invoices']]
+
+
+def test_search_by_client_prefix(client, add_invoice):
+    add_invoice('F1', 'f1.pdf', Client='Société Exemple')
+    add_invoice('F2', 'f2.pdf', Client='SOCIÉTÉ EXEMPLE 2')
+    add_invoice('F3', 'f3.pdf', Client='Autre Société')
+    add_invoice('F4', 'f4.pdf', Client='Soc_100%')
+
+    assert sorted(numbers(client.get('/invoices?client=soc'))) == ['F1', 'F2', 'F4']
+    assert numbers(client.get('/invoices?client=Autre')) == ['F3']
+    # Les jokers LIKE sont pris littéralement
+    assert numbers(client.get('/invoices?client=Soc_1')) == ['F4']
+    assert numbers(client.get('/invoices?client=%25')) == []
+
+
+def test_search_by_plate(client, add_invoice):
+    add_invoice('F1', 'f1.pdf', Matricule='12345-A-6')
+    add_invoice('F2', 'f2.pdf', Matricule='999-B-1')
+
+    assert numbers(client.get('/invoices?plate=999-b-1')) == ['F2']
+    assert numbers(client.get('/invoices?plate=12345')) == []
+
+
+def test_search_by_date_range(client, add_invoice):
+    for number, day in (('F1', '2024-01-31'), ('F2', '2024-02-01'), ('F3', '2024-02-29'), ('F4', '2024-03-01')):
+        add_invoice(number, f'{number}.pdf', **{'Date de facture': day})
+
+    assert numbers(client.get('/invoices?from=2024-02-01&to=2024-02-29')) == ['F3', 'F2']
+    assert numbers(client.get('/invoices?from=2024-02-29')) == ['F4', 'F3']
+    assert numbers(client.get('/invoices?to=2024-01-31')) == ['F1']
+    assert client.get('/invoices?from=01/02/2024').status_code == 400
+
+
+def test_search_pagination(client, add_invoice):
+    for day in range(1, 6):
+        add_invoice(f'F{day}', f'f{day}.pdf', **{'Date de facture': f'2024-03-0{day}'})
+
+    response = client.get('/invoices?per_page=2&page=2')
+    assert numbers(response) == ['F3', 'F2']
+    assert response.get_json()['total'] == 5
+    assert numbers(client.get('/invoices?per_page=2&page=3')) == ['F1']
+    assert numbers(client.get('/invoices?per_page=2&page=4')) == []
+    assert client.get('/invoices?page=deux').status_code == 400
+
+
+def test_sweep_forgets_invoices_of_deleted_files(client, add_invoice, tmp_path):
+    retention = RetentionIndex(str(tmp_path / 'output_index.db'))
+    storage = TrackedStorage(LocalStorage(str(tmp_path / 'output')), retention)
+    storage.put('old.pdf', b'%PDF-1.4 ancienne')
+    storage.put('new.pdf', b'%PDF-1.4 nouvelle')
+    add_invoice('F1', 'old.pdf', created=1)
+    add_invoice('F1', 'new.pdf', created=2)
+    add_invoice('F2', 'old.pdf', created=1)
+
+    # new.pdf est le plus récemment utilisé : seul old.pdf dépasse la limite
+    storage.get('new.pdf')
+    assert sweep_storage(storage, retention, 0, len(b'%PDF-1.4 nouvelle')) == 1
+
+    assert not storage.exists('old.pdf')
+    assert client.get('/invoices/F2/pdf').status_code == 404
+    assert client.get('/invoices/F1').get_json()['invoice']['file'] == 'new.pdf'
+    assert numbers(client.get('/invoices')) == ['F1']
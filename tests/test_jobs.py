@@ -0,0 +1,56 @@
+"""Tests de l'état des jobs et des lots"""
+import os
+import time
+
+import pytest
+
+import app as app_module
+from app import expire_jobs, load_job, new_job, save_batch, save_job
+
+
+@pytest.fixture
+def ttl(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'JOB_TTL', 3600)
+    monkeypatch.setattr(app_module, '_jobs_expired_at', 0.0)
+
+
+def age(job_id, seconds):
+    path = app_module._job_path(job_id)
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_save_batch_records_files():
+    result = {'success': True, 'files': ['a.pdf'], 'rows_done': 1, 'rows_failed': 0}
+    save_batch(result)
+    assert load_job(result['batch'])['files'] == ['a.pdf']
+
+
+def test_expired_jobs_are_removed(ttl):
+    old, recent = new_job(), new_job()
+    save_job(old)
+    save_job(recent)
+    age(old['id'], 7200)
+
+    expire_jobs()
+    assert load_job(old['id']) is None
+    assert load_job(recent['id']) is not None
+
+
+def test_expiry_runs_at_most_once_a_minute(ttl):
+    expire_jobs()
+    job = new_job()
+    save_job(job)
+    age(job['id'], 7200)
+    expire_jobs()
+    assert load_job(job['id']) is not None
+
+
+def test_ttl_zero_keeps_jobs(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'JOB_TTL', 0)
+    monkeypatch.setattr(app_module, '_jobs_expired_at', 0.0)
+    job = new_job()
+    save_job(job)
+    age(job['id'], 10 ** 8)
+    expire_jobs()
+    assert load_job(job['id']) is not None
@@ -0,0 +1,149 @@
+"""Tests des lecteurs de classeurs CSV et ODS"""
+import io
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import app as app_module
+from app import CsvBook, OdsBook, iter_ods_rows, parse_csv_amount
+
+ODS_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<office:document-content'
+    ' xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+    ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"'
+    ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">'
+    '<office:body><office:spreadsheet>'
+)
+ODS_FOOTER = '</office:spreadsheet></office:body></office:document-content>'
+
+
+def text(value, repeat=None):
+    attrs = f' table:number-columns-repeated="{repeat}"' if repeat else ''
+    return f'<table:table-cell office:value-type="string"{attrs}><text:p>{value}</text:p></table:table-cell>'
+
+
+def number(value):
+    return f'<table:table-cell office:value-type="float" office:value="{value}"><text:p>{value}</text:p></table:table-cell>'
+
+
+def empty(repeat=None):
+    attrs = f' table:number-columns-repeated="{repeat}"' if repeat else ''
+    return f'<table:table-cell{attrs}/>'
+
+
+def row(*cells, repeat=None):
+    attrs = f' table:number-rows-repeated="{repeat}"' if repeat else ''
+    return f'<table:table-row{attrs}>{"".join(cells)}</table:table-row>'
+
+
+def content(**tables):
+    body = ''.join(f'<table:table table:name="{name}">{"".join(rows)}</table:table>' for name, rows in tables.items())
+    return (ODS_HEADER + body + ODS_FOOTER).encode()
+
+
+def rows_of(xml, sheet=None):
+    return list(iter_ods_rows(io.BytesIO(xml), sheet))
+
+
+def test_cell_types():
+    xml = content(Feuille1=[row(
+        number('12'),
+        number('12.5'),
+        '<table:table-cell office:value-type="currency" office:value="7"/>',
+        '<table:table-cell office:value-type="date" office:date-value="2024-03-01T10:30:00"/>',
+        '<table:table-cell office:value-type="boolean" office:boolean-value="true"/>',
+        '<table:table-cell office:value-type="string"><text:p>Ligne 1</text:p><text:p>Ligne <text:span>2</text:span></text:p></table:table-cell>',
+    )])
+    assert rows_of(xml) == [(12, 12.5, 7, datetime(2024, 3, 1, 10, 30), True, 'Ligne 1\nLigne 2')]
+
+
+def test_repeated_empty_cells_keep_columns_aligned():
+    xml = content(Feuille1=[row(text('A'), empty(3), text('B'), empty(1020))])
+    assert rows_of(xml) == [('A', None, None, None, 'B')]
+
+
+def test_repeated_value_cells():
+    xml = content(Feuille1=[row(text('x', repeat=3), number('1'))])
+    assert rows_of(xml) == [('x', 'x', 'x', 1)]
+
+
+def test_repeated_empty_rows_in_the_middle_and_at_the_end():
+    xml = content(Feuille1=[
+        row(text('A')),
+        row(empty(1024), repeat=2),
+        row(text('B'), repeat=2),
+        row(empty(1024), repeat=1048570),
+    ])
+    assert rows_of(xml) == [('A',), (), (), ('B',), ('B',)]
+
+
+def test_covered_cells_of_merged_ranges():
+    xml = content(Feuille1=[row(
+        '<table:table-cell office:value-type="string" table:number-columns-spanned="2"><text:p>Fusion</text:p></table:table-cell>',
+        '<table:covered-table-cell/>',
+        text('C'),
+    )])
+    assert rows_of(xml) == [('Fusion', None, 'C')]
+
+
+def test_sheet_selection():
+    xml = content(Premiere=[row(text('1'))], Seconde=[row(text('2')), row(text('3'))])
+    assert rows_of(xml) == [('1',)]
+    assert rows_of(xml, 'Seconde') == [('2',), ('3',)]
+    assert rows_of(xml, 'Absente') == []
+
+
+def ods_archive(xml):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('mimetype', 'application/vnd.oasis.opendocument.spreadsheet')
+        archive.writestr('content.xml', xml)
+    buffer.seek(0)
+    return buffer
+
+
+def test_ods_book():
+    xml = content(Premiere=[row(text('1'))], Seconde=[row(text('2'))])
+    book = OdsBook(ods_archive(xml))
+    assert book.sheet_names() == ['Premiere', 'Seconde']
+    assert book.active_sheet() == 'Premiere'
+    rows, total = book.rows('Seconde')
+    assert list(rows) == [('2',)] and total is None
+    book.close()
+
+
+@pytest.mark.parametrize('value, decimal_comma, expected', [
+    ('1 234,50', True, Decimal('1234.50')),
+    ('1\u00a0234,50', True, Decimal('1234.50')),
+    ('1.234,50', True, Decimal('1234.50')),
+    ('1,234.50', True, Decimal('1234.50')),
+    ('1234.5', True, Decimal('1234.5')),
+    ('1,234.50', False, Decimal('1234.50')),
+    ('1.234,50', False, Decimal('1234.50')),
+    ('1234.5', False, Decimal('1234.5')),
+    # Sans virgule décimale, une virgule seule sépare les milliers
+    ('1 234,50', False, Decimal('123450')),
+    ('-12,5', True, Decimal('-12.5')),
+    ('n/a', True, 'n/a'),
+])
+def test_parse_csv_amount(value, decimal_comma, expected):
+    assert parse_csv_amount(value, decimal_comma) == expected
+
+
+@pytest.mark.parametrize('decimal_comma, amount', [(True, '1 234,50'), (False, '1,234.50')])
+def test_csv_book_reads_amounts(monkeypatch, make_row, decimal_comma, amount):
+    monkeypatch.setitem(app_module.app.config, 'CSV_DECIMAL_COMMA', decimal_comma)
+    headers, values = make_row()
+    values[headers.index('TOTAL TTC')] = amount
+    data = (';'.join(headers) + '\n' + ';'.join(map(str, values)) + '\n').encode()
+    source = io.BytesIO(data)
+    book = CsvBook(source)
+    rows, total = book.rows(book.active_sheet())
+    assert next(rows) == headers
+    assert next(rows)[headers.index('TOTAL TTC')] == Decimal('1234.50')
+    book.close()
+    # Le tampon appartient à l'appelant
+    assert not source.closed
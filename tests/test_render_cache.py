@@ -0,0 +1,56 @@
+"""Tests du cache des factures rendues"""
+import os
+
+import pytest
+
+import app as app_module
+from app import RenderCache
+
+
+def pdfs(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith('.pdf'))
+
+
+def test_lru_eviction(tmp_path):
+    cache = RenderCache(str(tmp_path), max_entries=2, max_bytes=1000)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    assert cache.get('a') == b'1'
+    cache.put('c', b'3')
+    assert pdfs(tmp_path) == ['a.pdf', 'c.pdf']
+    assert cache.get('b') is None
+
+
+def test_size_limit(tmp_path):
+    cache = RenderCache(str(tmp_path), max_entries=100, max_bytes=10)
+    cache.put('a', b'123456')
+    cache.put('b', b'123456')
+    assert pdfs(tmp_path) == ['b.pdf']
+
+
+def test_entries_of_other_workers_are_shared(tmp_path):
+    first = RenderCache(str(tmp_path), max_entries=10, max_bytes=1000)
+    second = RenderCache(str(tmp_path), max_entries=10, max_bytes=1000)
+    first.put('a', b'1')
+    second.get('z')
+    first.put('b', b'2')
+    # Indexé par le premier après la construction de l'index du second
+    assert second.get('b') == b'2'
+
+
+def test_limits_apply_to_the_shared_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'RENDER_CACHE_RESCAN_INTERVAL', 0)
+    workers = [RenderCache(str(tmp_path), max_entries=3, max_bytes=1000) for _ in range(3)]
+    for i, cache in enumerate(workers * 2):
+        cache.put(f'k{i}', b'x')
+        # Ordre LRU commun : la date de modification des fichiers
+        os.utime(tmp_path / f'k{i}.pdf', (i, i))
+    assert pdfs(tmp_path) == ['k3.pdf', 'k4.pdf', 'k5.pdf']
+
+
+def test_missing_file_is_forgotten(tmp_path):
+    cache = RenderCache(str(tmp_path), max_entries=10, max_bytes=1000)
+    cache.put('a', b'1')
+    os.remove(tmp_path / 'a.pdf')
+    assert cache.get('a') is None
+    assert cache._size == 0
@@ -0,0 +1,224 @@
+"""Tests des stockages de PDF (S3, mémoire, à deux niveaux)"""
+import io
+import os
+
+import pytest
+
+from app import LocalStorage, MemoryStorage, RetentionIndex, S3Storage, TieredStorage, TrackedStorage
+
+
+class ClientError(Exception):
+    """Erreur au format de botocore : le code est dans response['Error']['Code']"""
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """Client S3 en mémoire offrant les quatre appels utilisés par S3Storage"""
+    def __init__(self):
+        self.objects = {}
+        self.error = None
+
+    def _fail(self):
+        if self.error is not None:
+            raise ClientError(self.error)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self._fail()
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        self._fail()
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('NoSuchKey')
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        self._fail()
+        if (Bucket, Key) not in self.objects:
+            # HEAD n'a pas de corps : botocore ne remonte que le statut
+            raise ClientError('404')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self._fail()
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client()
+
+
+def test_s3_put_get_exists_delete(client):
+    storage = S3Storage('factures', prefix='pdf/', client=client)
+    storage.put('facture_1.pdf', b'%PDF-1')
+
+    assert client.objects == {('factures', 'pdf/facture_1.pdf'): b'%PDF-1'}
+    assert storage.exists('facture_1.pdf')
+    assert storage.get('facture_1.pdf') == b'%PDF-1'
+    assert storage.local_path('facture_1.pdf') is None
+
+    storage.delete('facture_1.pdf')
+    assert not storage.exists('facture_1.pdf')
+    assert storage.get('facture_1.pdf') is None
+
+
+def test_s3_key_uses_secure_filename(client):
+    storage = S3Storage('factures', client=client)
+    storage.put('../../etc/facture.pdf', b'x')
+    assert list(client.objects) == [('factures', 'etc_facture.pdf')]
+
+
+@pytest.mark.parametrize('code', ['404', 'NoSuchKey', 'NotFound'])
+def test_s3_missing_object(client, code):
+    storage = S3Storage('factures', client=client)
+    client.error = code
+    assert storage.get('absent.pdf') is None
+    assert storage.exists('absent.pdf') is False
+
+
+def test_s3_other_errors_propagate(client):
+    storage = S3Storage('factures', client=client)
+    client.error = 'AccessDenied'
+    with pytest.raises(ClientError):
+        storage.get('facture.pdf')
+    with pytest.raises(ClientError):
+        storage.exists('facture.pdf')
+
+
+def test_s3_delete_missing_object_is_silent(client):
+    S3Storage('factures', client=client).delete('absent.pdf')
+
+
+def test_memory_storage_evicts_least_recently_used():
+    storage = MemoryStorage(max_bytes=10)
+    storage.put('a', b'1234')
+    storage.put('b', b'1234')
+    # Lire 'a' le rend plus récent que 'b'
+    assert storage.get('a') == b'1234'
+    storage.put('c', b'1234')
+
+    assert storage.exists('a')
+    assert not storage.exists('b')
+    assert storage.exists('c')
+    assert storage.get('b') is None
+
+
+def test_memory_storage_replace_and_delete_keep_size():
+    storage = MemoryStorage(max_bytes=10)
+    storage.put('a', b'123456')
+    storage.put('a', b'123456')
+    storage.put('b', b'1234')
+    assert storage.exists('a') and storage.exists('b')
+
+    storage.delete('a')
+    storage.put('c', b'123456')
+    assert storage.exists('b') and storage.exists('c')
+
+
+def test_memory_storage_drops_file_larger_than_limit():
+    storage = MemoryStorage(max_bytes=4)
+    storage.put('gros', b'123456')
+    assert not storage.exists('gros')
+
+
+def test_tiered_storage_writes_both_tiers(client):
+    hot = MemoryStorage(max_bytes=100)
+    backend = S3Storage('factures', client=client)
+    storage = TieredStorage(hot, backend)
+
+    storage.put('facture.pdf', b'%PDF')
+    assert hot.get('facture.pdf') == b'%PDF'
+    assert backend.get('facture.pdf') == b'%PDF'
+    assert storage.local_path('facture.pdf') is None
+
+
+def test_tiered_storage_reads_through_and_fills_hot_tier(client):
+    hot = MemoryStorage(max_bytes=100)
+    backend = S3Storage('factures', client=client)
+    backend.put('ancienne.pdf', b'%PDF')
+    storage = TieredStorage(hot, backend)
+
+    assert storage.exists('ancienne.pdf')
+    assert not hot.exists('ancienne.pdf')
+    assert storage.get('ancienne.pdf') == b'%PDF'
+    assert hot.exists('ancienne.pdf')
+
+    # Une fois en mémoire, le stockage principal n'est plus interrogé
+    client.error = 'AccessDenied'
+    assert storage.get('ancienne.pdf') == b'%PDF'
+
+
+def test_tiered_storage_missing_and_delete(client):
+    hot = MemoryStorage(max_bytes=100)
+    backend = S3Storage('factures', client=client)
+    storage = TieredStorage(hot, backend)
+
+    assert storage.get('absent.pdf') is None
+    assert not hot.exists('absent.pdf')
+
+    storage.put('facture.pdf', b'%PDF')
+    storage.delete('facture.pdf')
+    assert not storage.exists('facture.pdf')
+    assert client.objects == {}
+
+
+def test_tiered_storage_local_path_falls_back_to_backend(tmp_path):
+    hot = MemoryStorage(max_bytes=4)
+    backend = LocalStorage(str(tmp_path))
+    storage = TieredStorage(hot, backend)
+
+    # Trop gros pour la mémoire : servi depuis le disque
+    storage.put('facture.pdf', b'%PDF-1.4')
+    assert storage.local_path('facture.pdf') == str(tmp_path / 'facture.pdf')
+
+
+def test_tracked_memory_storage_reports_evictions(tmp_path):
+    index = RetentionIndex(str(tmp_path / 'index.db'))
+    storage = TrackedStorage(MemoryStorage(max_bytes=10), index)
+    storage.put('a', b'1234')
+    storage.put('b', b'1234')
+    storage.put('c', b'1234')
+    # 'a' évincé par le stockage en mémoire : l'index ne le compte plus
+    assert index.over_capacity(8) == []
+    assert index.over_capacity(7) == ['b']
+
+    storage.put('gros', b'0123456789ab')
+    assert not storage.exists('gros')
+    assert index.over_capacity(0) == []
+
+
+def test_tracked_tiered_storage_keeps_files_evicted_from_memory(tmp_path):
+    index = RetentionIndex(str(tmp_path / 'index.db'))
+    backend = LocalStorage(str(tmp_path / 'output'))
+    storage = TrackedStorage(TieredStorage(MemoryStorage(max_bytes=4), backend), index)
+    storage.put('a', b'1234')
+    storage.put('b', b'1234')
+    # Évincé de la mémoire mais toujours sur le disque : toujours indexé
+    assert index.over_capacity(4) == ['a']
+
+
+def test_local_put_from_links_the_file(tmp_path):
+    source = tmp_path / 'cache.pdf'
+    source.write_bytes(b'%PDF')
+    storage = LocalStorage(str(tmp_path / 'output'))
+    storage.put_from('facture.pdf', b'%PDF', str(source))
+    assert os.path.samefile(storage.local_path('facture.pdf'), source)
+
+
+def test_local_put_from_writes_when_the_source_is_gone(tmp_path):
+    storage = LocalStorage(str(tmp_path / 'output'))
+    storage.put_from('facture.pdf', b'%PDF', str(tmp_path / 'evince.pdf'))
+    assert storage.get('facture.pdf') == b'%PDF'
+
+
+def test_put_from_copies_for_memory_and_s3(tmp_path, client):
+    source = tmp_path / 'cache.pdf'
+    source.write_bytes(b'%PDF')
+    memory = MemoryStorage(max_bytes=100)
+    s3 = S3Storage('factures', client=client)
+    for storage in (memory, s3):
+        storage.put_from('facture.pdf', b'%PDF', str(source))
+        assert storage.get('facture.pdf') == b'%PDF'
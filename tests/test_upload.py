@@ -0,0 +1,126 @@
+"""Tests des modes de réponse de /upload"""
+import io
+import json
+import os
+import tempfile
+import time
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def csv_workbook(make_row, numbers):
+    """Classeur CSV d'une facture par numéro"""
+    headers, row = make_row()
+    lines = [';'.join(headers)]
+    for number in numbers:
+        values = [number] + row[1:]
+        lines.append(';'.join(str(value).replace('.', ',') if isinstance(value, float) else str(value)
+                              for value in values))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@pytest.fixture
+def workbook(make_row):
+    return csv_workbook(make_row, ('C1', 'C2', 'C3'))
+
+
+@pytest.fixture
+def xlsx_workbook(make_row):
+    """Classeur XLSX de trois factures"""
+    import openpyxl
+    headers, row = make_row()
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(headers)
+    for number in ('X1', 'X2', 'X3'):
+        sheet.append([number] + row[1:])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class LegacySpool(tempfile.SpooledTemporaryFile):
+    """Interface de SpooledTemporaryFile avant Python 3.11 : ni seekable() ni readable()"""
+    def __getattribute__(self, name):
+        if name in ('seekable', 'readable'):
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+
+@pytest.fixture(params=[16 * 1024 * 1024, 1], ids=['memory', 'spilled'])
+def legacy_spool(request, monkeypatch):
+    """Tampons d'upload à l'ancienne interface, en mémoire ou débordés sur disque"""
+    monkeypatch.setattr(app_module.tempfile, 'SpooledTemporaryFile', LegacySpool)
+    monkeypatch.setitem(app_module.app.config, 'SPOOL_MAX_MEMORY', request.param)
+
+
+def upload(client, workbook, filename='factures.csv', **fields):
+    data = {'file': (io.BytesIO(workbook), filename), 'validation': 'continue', **fields}
+    return client.post('/upload', data=data)
+
+
+def wait_for_job(client, job_id):
+    for _ in range(100):
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f'job {job_id} toujours en cours')
+
+
+def test_async_job_lists_written_files(client, workbook):
+    response = upload(client, workbook, **{'async': '1'})
+    assert response.status_code == 202
+    job = wait_for_job(client, response.get_json()['job'])
+    assert job['status'] == 'done'
+    assert job['rows_done'] == 3
+    assert len(job['files']) == 3
+    assert job['validation'] == []
+
+
+def test_stream_events(client, workbook):
+    response = upload(client, workbook, stream='1')
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [event['type'] for event in events] == ['start', 'row', 'row', 'row', 'result']
+    assert sorted(event['invoice'] for event in events[1:4]) == ['C1', 'C2', 'C3']
+    assert all(event['status'] in ('rendered', 'cached') and event['validation'] is None for event in events[1:4])
+    assert events[-1]['success'] and len(events[-1]['files']) == 3
+
+
+def test_xlsx_upload_from_spool(client, xlsx_workbook, legacy_spool):
+    result = upload(client, xlsx_workbook, 'factures.xlsx').get_json()
+    assert result['success'], result
+    assert result['rows_done'] == 3
+
+
+def test_xlsx_async_upload_from_spool(client, xlsx_workbook, legacy_spool):
+    response = upload(client, xlsx_workbook, 'factures.xlsx', **{'async': '1'})
+    job = wait_for_job(client, response.get_json()['job'])
+    assert job['status'] == 'done', job
+    assert job['rows_done'] == 3
+
+
+def test_rendered_pdfs_are_written_once(client, make_row):
+    result = upload(client, csv_workbook(make_row, ('L1', 'L2', 'L3'))).get_json()
+    assert result['rows_done'] == 3
+    cache_folder = app_module.app.config['CACHE_FOLDER']
+    for filename in result['files']:
+        key_prefix = filename.rsplit('_', 1)[1][:-len('.pdf')]
+        cached = [name for name in os.listdir(cache_folder) if name.startswith(key_prefix)]
+        # Le PDF du dossier de sortie est le fichier du cache, lié et non copié
+        assert os.path.samefile(os.path.join(app_module.app.config['OUTPUT_FOLDER'], filename),
+                                os.path.join(cache_folder, cached[0]))
+
+
+def test_csv_upload_from_spool(client, workbook, legacy_spool):
+    result = upload(client, workbook).get_json()
+    assert result['success'], result
+    assert result['rows_done'] == 3
@@ -0,0 +1,102 @@
+"""Tests de la vérification des totaux"""
+import random
+
+import pytest
+
+from app import (InvoiceSchema, check_invoice_rows, check_invoice_totals, process_sheet,
+                 validate_invoice_rows)
+
+
+def typed(make_row, overrides=None):
+    headers, row = make_row(overrides)
+    return InvoiceSchema(headers).decode(row)
+
+
+class ListBook:
+    """Classeur d'une feuille dont les lignes sont données"""
+    def __init__(self, rows):
+        self._rows = rows
+
+    def rows(self, name):
+        return iter(self._rows), len(self._rows) - 1
+
+
+def test_consistent_invoice(make_row):
+    invoice = typed(make_row)
+    assert check_invoice_totals(invoice) == []
+    assert validate_invoice_rows([(2, invoice)]) == []
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'CDW HT': 120}, "Total Location HT différent de la somme des prestations : 1 170,50 attendu, 1 150,50 trouvé"),
+    ({'TVA 20 %': 230, 'TOTAL TTC': 1380.5}, "TVA 20 % différente de 20 % du Total Location HT : 230,10 attendu, 230,00 trouvé"),
+    ({'TOTAL TTC': 1390.6}, "TOTAL TTC différent de Total Location HT + TVA : 1 380,60 attendu, 1 390,60 trouvé"),
+])
+def test_each_check(make_row, overrides, message):
+    invoice = typed(make_row, overrides)
+    assert check_invoice_totals(invoice) == [message]
+    assert validate_invoice_rows([(2, invoice)]) == [{'row': 2, 'invoice': 'F001', 'errors': [message]}]
+
+
+def test_several_errors_on_one_row(make_row):
+    invoice = typed(make_row, {'Total Location HT': 1200})
+    # HT faux : la somme des prestations, la TVA et le TTC ne concordent plus
+    assert len(check_invoice_totals(invoice)) == 3
+
+
+def test_tolerance(make_row):
+    invoice = typed(make_row, {'TOTAL TTC': 1380.61})
+    assert check_invoice_totals(invoice) == []
+    assert check_invoice_totals(invoice, tolerance=0) != []
+    invoice = typed(make_row, {'TOTAL TTC': 1380.62})
+    assert check_invoice_totals(invoice) != []
+    assert validate_invoice_rows([(2, invoice)], tolerance=2) == []
+
+
+def test_buffered_and_streamed_reports_agree(make_row):
+    rng = random.Random(15)
+    invoice_rows = []
+    for row_idx in range(2, 502):
+        ht = rng.randrange(1000, 100000)
+        tva = (ht * 20 + 50) // 100
+        overrides = {
+            'Facture Numero': f'F{row_idx}',
+            'Prix location total HT': (ht - 100) / 100,
+            'CDW HT': 1,
+            'GPS HT': 0,
+            'Total Location HT': (ht + rng.choice([0, 0, 0, 2])) / 100,
+            'TVA 20 %': (tva + rng.choice([0, 0, 0, -3])) / 100,
+            'TOTAL TTC': (ht + tva + rng.choice([0, 0, 1, 5])) / 100,
+        }
+        invoice_rows.append((row_idx, typed(make_row, overrides)))
+
+    report = validate_invoice_rows(invoice_rows)
+    streamed = []
+    assert list(check_invoice_rows(invoice_rows, streamed.append)) == invoice_rows
+    assert streamed == report
+    assert report and len(report) < len(invoice_rows)
+
+
+def test_continue_mode_reports_while_rendering(make_row):
+    headers, good = make_row()
+    bad = make_row({'Facture Numero': 'F002', 'TVA 20 %': 200})[1]
+    book = ListBook([headers, good, bad, good])
+    events = []
+
+    def on_row(event):
+        # Le rapport de la ligne accompagne son rendu, pas la fin de la feuille
+        events.append((event['row'], event['status'], event['validation']))
+
+    result = process_sheet(book, 'Feuille1', output_mode='merged', validation='continue', on_row=on_row)
+    assert result['rows_done'] == 3
+    assert [entry['row'] for entry in result['validation']] == [3]
+    assert events[0] == (2, 'rendered', None)
+    assert events[1][0] == 3 and len(events[1][2]) == 2
+
+
+def test_refuse_mode_renders_nothing(make_row):
+    headers, good = make_row()
+    bad = make_row({'TOTAL TTC': 1})[1]
+    result = process_sheet(ListBook([headers, good, bad]), 'Feuille1', validation='refuse')
+    assert result['success'] is False
+    assert [entry['row'] for entry in result['validation']] == [3]